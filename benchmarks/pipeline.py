@@ -0,0 +1,185 @@
+"""
+Per-stage timings of the compress_image pipeline, with baseline comparison.
+
+Each image of the size x k matrix is JPEG-encoded in memory first, then run
+through the same steps as compress_image, timing each one separately:
+decode and float conversion (the app's own load_pixels and float_planes),
+SVD (all channels), reconstruction (the rank-k
+product), clipping (clip and cast to uint8), the fused reconstruct_rank_k
+actually used by the app, and the JPEG quality loop. Every cell is repeated
+and the median is kept.
+
+Usage (from the repository root):
+    python benchmarks/pipeline.py --json base.json
+    # ... change an SVD backend or the encoder ...
+    python benchmarks/pipeline.py --json new.json --baseline base.json
+
+With --baseline the exit status is 1 if any stage got slower than
+--threshold (relative) and --min-delta (absolute seconds).
+"""
+import argparse
+import glob
+import io
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src", "app"))
+from svd import (MEMMAP_MIN_PIXELS, SVD_METHODS, float_planes, load_pixels,  # noqa: E402
+                 reconstruct_rank_k, save_reconstruction, svd_factors)
+from tiled import psnr, synthetic_image  # noqa: E402
+
+SAMPLES = sorted(glob.glob(os.path.join(os.path.dirname(__file__), "..", "test", "*.jpg")))
+STAGES = ("decode", "to_float", "svd", "reconstruct", "clip", "reconstruct_rank_k", "encode")
+
+
+def sample_image(path: str, width: int, height: int) -> np.ndarray:
+    return np.asarray(Image.open(path).convert("RGB").resize((width, height), Image.BICUBIC))
+
+
+def jpeg_bytes(pixels: np.ndarray) -> bytes:
+    buf = io.BytesIO()
+    Image.fromarray(pixels).save(buf, format="JPEG", quality=90)
+    return buf.getvalue()
+
+
+def run_once(data: bytes, k: int, method: str, memmap_min_pixels: int = MEMMAP_MIN_PIXELS) -> dict:
+    """One pass through the pipeline; returns stage timings and the result."""
+    times = {}
+
+    def timed(stage, fn):
+        start = time.perf_counter()
+        out = fn()
+        times[stage] = time.perf_counter() - start
+        return out
+
+    pixels = timed("decode", lambda: load_pixels(None, data))
+    height, width, _ = pixels.shape
+    k = max(1, min(k, height, width))
+    channels = timed("to_float", lambda: float_planes(pixels, memmap_min_pixels))
+    U, S, Vt, used, rel_error = timed("svd", lambda: svd_factors(channels, k, method))
+
+    Us = U[..., :k] * S[..., None, :k]
+    product = timed("reconstruct", lambda: np.matmul(Us, Vt[..., :k, :]))
+    recon = np.empty((height, width, 3), dtype=np.uint8)
+
+    def clip():
+        np.clip(product, 0, 255, out=product)
+        np.copyto(np.moveaxis(recon, -1, 0), product, casting="unsafe")
+
+    timed("clip", clip)
+    fused = np.empty_like(recon)
+    timed("reconstruct_rank_k", lambda: reconstruct_rank_k(U, S, Vt, k, fused))
+
+    out_path, after_size = timed("encode", lambda: save_reconstruction(fused, len(data), k / min(height, width)))
+    os.remove(out_path)
+    return {"times": times, "method": used, "after_bytes": after_size,
+            "rel_error": float(np.max(rel_error)), "psnr_db": psnr(fused, pixels)}
+
+
+def run_matrix(sizes, ks, method: str, repeat: int, samples,
+               memmap_min_pixels: int = MEMMAP_MIN_PIXELS) -> list:
+    results = []
+    for size in sizes:
+        width, height = map(int, size.split("x"))
+        images = [("synthetic", synthetic_image(width, height))]
+        images += [(os.path.basename(p), sample_image(p, width, height)) for p in samples]
+        for name, pixels in images:
+            data = jpeg_bytes(pixels)
+            for k in ks:
+                runs = [run_once(data, k, method, memmap_min_pixels) for _ in range(repeat)]
+                stages = {s: round(statistics.median(r["times"][s] for r in runs), 4) for s in STAGES}
+                row = {
+                    "image": name, "size": size, "k": k, "method": runs[0]["method"],
+                    "stages": stages,
+                    "total": round(sum(stages[s] for s in STAGES if s not in ("reconstruct", "clip")), 4),
+                    "before_bytes": len(data), "after_bytes": runs[0]["after_bytes"],
+                    "rel_error": round(runs[0]["rel_error"], 5), "psnr_db": round(runs[0]["psnr_db"], 2),
+                }
+                results.append(row)
+                print(f"{name:24.24s} {size:>10s} k={k:<4d} {row['method']:10s} "
+                      + " ".join(f"{s}={stages[s]:.3f}" for s in STAGES)
+                      + f"  total={row['total']:.3f}s")
+    return results
+
+
+def row_key(row: dict) -> tuple:
+    return row["image"], row["size"], row["k"]
+
+
+def compare(results: list, baseline: list, threshold: float, min_delta: float) -> int:
+    """Print stage ratios against the baseline; return the number of regressions."""
+    base = {row_key(row): row for row in baseline}
+    regressions = 0
+    print(f"\n{'image':24s} {'size':>10s} {'k':>4s} {'stage':18s} {'base':>8s} {'new':>8s} {'ratio':>7s}")
+    for row in results:
+        old = base.get(row_key(row))
+        if old is None:
+            continue
+        for stage in STAGES + ("total",):
+            before = old["total"] if stage == "total" else old["stages"].get(stage)
+            after = row["total"] if stage == "total" else row["stages"][stage]
+            if not before:
+                continue
+            ratio = after / before
+            slower = ratio > 1 + threshold and after - before > min_delta
+            regressions += slower and stage != "total"
+            if slower or stage == "total":
+                flag = "  REGRESSION" if slower else ""
+                print(f"{row['image']:24.24s} {row['size']:>10s} {row['k']:>4d} {stage:18s} "
+                      f"{before:8.3f} {after:8.3f} {ratio:7.2f}{flag}")
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", nargs="+", default=["640x480", "1280x960", "2560x1920"])
+    parser.add_argument("--ks", type=int, nargs="+", default=[5, 20, 50, 100])
+    parser.add_argument("--method", choices=SVD_METHODS, default="auto")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--memmap-megapixels", type=float, default=MEMMAP_MIN_PIXELS / 1e6,
+                        help="file-backed float planes from this size, as in the app; 0 disables "
+                             "(default %(default)g)")
+    parser.add_argument("--no-samples", action="store_true", help="only use the synthetic image")
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--baseline", help="compare against a file written by --json")
+    parser.add_argument("--threshold", type=float, default=0.10, help="relative slowdown counted as a regression")
+    parser.add_argument("--min-delta", type=float, default=0.005, help="ignore slowdowns below this many seconds")
+    args = parser.parse_args()
+
+    memmap_min_pixels = int(args.memmap_megapixels * 1e6) or None
+    results = run_matrix(args.sizes, args.ks, args.method, args.repeat, [] if args.no_samples else SAMPLES,
+                         memmap_min_pixels)
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+            "cpus": os.cpu_count(),
+            "method": args.method,
+            "repeat": args.repeat,
+            "memmap_min_pixels": memmap_min_pixels,
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "results": results,
+    }
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f)["results"], args.threshold, args.min_delta)
+        print(f"\n{regressions} stage regression(s) above {args.threshold:.0%}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,99 @@
+"""
+Quality vs. time of block-wise (tiled) SVD against the global SVD.
+
+Usage (from the repository root):
+    python benchmarks/tiled.py [--sizes 2000x1500 4000x3000] [--k 50] [--json out.json]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src", "app"))
+from svd import compress_tiles, reconstruct_rank_k, svd_factors, tile_rank_for  # noqa: E402
+
+SAMPLE = os.path.join(os.path.dirname(__file__), "..", "test", "Gambar Asli Test.jpg")
+
+
+def synthetic_image(width: int, height: int, seed: int = 0) -> np.ndarray:
+    """Smooth gradients, hard-edged shapes and sensor-like noise."""
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    img = np.empty((height, width, 3), dtype=np.float32)
+    img[..., 0] = 128 + 100 * np.sin(x / width * 6) * np.cos(y / height * 4)
+    img[..., 1] = 255 * x / width
+    img[..., 2] = 255 * y / height
+    for _ in range(20):
+        cx, cy, r = rng.integers(0, width), rng.integers(0, height), rng.integers(20, min(width, height) // 6)
+        img[(x - cx) ** 2 + (y - cy) ** 2 < r * r] = rng.integers(0, 256, 3)
+    img += rng.normal(0, 6, img.shape)
+    return img.clip(0, 255).astype(np.uint8)
+
+
+def sample_image(width: int, height: int) -> np.ndarray:
+    return np.asarray(Image.open(SAMPLE).convert("RGB").resize((width, height), Image.BICUBIC))
+
+
+def psnr(a: np.ndarray, b: np.ndarray) -> float:
+    mse = np.mean((a.astype(np.float64) - b) ** 2)
+    return float("inf") if mse == 0 else 10 * np.log10(255.0 ** 2 / mse)
+
+
+def measure(fn):
+    tracemalloc.start()
+    start = time.perf_counter()
+    out = fn()
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return out, elapsed, peak
+
+
+def global_svd(pixels: np.ndarray, k: int) -> np.ndarray:
+    planes = pixels.transpose(2, 0, 1).astype(np.float32, order="C")
+    U, S, Vt, _, _ = svd_factors(planes, k)
+    out = np.empty_like(pixels)
+    return reconstruct_rank_k(U, S, Vt, k, out)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", nargs="+", default=["2000x1500", "4000x3000"])
+    parser.add_argument("--k", type=int, default=50)
+    parser.add_argument("--tiles", type=int, nargs="+", default=[128, 256, 512])
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    results = []
+    for size in args.sizes:
+        width, height = map(int, size.split("x"))
+        for name, make in (("synthetic", synthetic_image), ("sample", sample_image)):
+            pixels = make(width, height)
+            runs = [("global", lambda: global_svd(pixels, args.k))]
+            for tile in args.tiles:
+                rank = tile_rank_for(args.k, (height, width), tile)
+                runs.append((f"tile{tile}/r{rank}",
+                             lambda tile=tile, rank=rank: compress_tiles(pixels, rank, tile)[0]))
+            for mode, fn in runs:
+                recon, elapsed, peak = measure(fn)
+                row = {
+                    "image": name, "size": size, "k": args.k, "mode": mode,
+                    "seconds": round(elapsed, 3), "peak_mb": round(peak / 2 ** 20, 1),
+                    "psnr_db": round(psnr(recon, pixels), 2),
+                }
+                results.append(row)
+                print(f"{name:9s} {size:>10s} {mode:14s} {row['seconds']:8.3f}s "
+                      f"{row['peak_mb']:8.1f} MB {row['psnr_db']:7.2f} dB")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,22 +1,103 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, send_file, jsonify
-from werkzeug.utils import secure_filename
+from flask import Flask, Response, render_template, request, redirect, url_for, flash, send_file, jsonify
+from werkzeug.utils import safe_join, secure_filename
 import os
+import io
+import json
+import base64
 import tempfile
 import shutil
 import time
+import zipfile
 import logging
+import threading
 from PIL import Image
-from svd import compress_image
-from utils import allowed_file, get_file_hash, load_cache, save_cache, cleanup_old_files
-from health import health_bp
+from batch import ArchiveTooLarge, compress_batch, extract_zip, zip_results
+from svd import (COLOR_SPACES, MEMMAP_MIN_PIXELS, TILED_MIN_PIXELS, compress_image, compress_sweep,
+                 load_factors, progressive_reconstruct)
+from svd_format import CODECS, QUANTS, write_svd
+from factor_cache import FactorCache
+from hot_cache import HotCache
+from cache_store import CacheStore
+from cache_manager import CacheManager
+from singleflight import SingleFlight
+from jobs import JobManager, QueueFull, compress_job, default_workers
+from utils import (allowed_file, cache_result, get_file_hash, get_cache_size, make_cache_key, save_upload,
+                   BLOB_NAME_CHARS, CACHE_METADATA_SUFFIXES)
+from health import INFLIGHT, health_bp
+from metrics import metrics_bp
+import metrics
 
 UPLOAD_FOLDER = os.path.join(tempfile.gettempdir(), "svd_uploads")
 CACHE_FOLDER = os.path.join(tempfile.gettempdir(), "svd_cache")
-CACHE_FILE = os.path.join(CACHE_FOLDER, "cache.json")
+CACHE_FILE = os.path.join(CACHE_FOLDER, "cache.db")
+LOCK_FOLDER = os.path.join(tempfile.gettempdir(), "svd_locks")
+# Ranks shown by /stream before the requested one
+STREAM_STEPS = (5, 20, 50)
+FACTOR_FOLDER = os.path.join(tempfile.gettempdir(), "svd_factors")
+# PSNR (dB) a fixed-k compression may lose by decomposing a downscaled copy
+# of the image instead of the full one, e.g. svd.DOWNSCALE_MAX_LOSS_DB; unset
+# or 0 always decomposes at full size
+MAX_PSNR_LOSS = float(os.environ.get('DOWNSCALE_MAX_LOSS_DB', 0)) or None
+# Images of at least this many megapixels keep their float planes in a
+# temporary file the kernel can reclaim, instead of in worker memory
+MEMMAP_PIXELS = int(float(os.environ.get('MEMMAP_MIN_MEGAPIXELS', MEMMAP_MIN_PIXELS / 1e6)) * 1e6) or None
+# Images of at least this many megapixels are compressed tile by tile
+TILED_PIXELS = int(float(os.environ.get('TILED_MIN_MEGAPIXELS', TILED_MIN_PIXELS / 1e6)) * 1e6) or None
+# Server-side compress_image options shared by every route
+COMPRESS_OPTIONS = {'max_psnr_loss': MAX_PSNR_LOSS, 'memmap_min_pixels': MEMMAP_PIXELS,
+                    'tiled_min_pixels': TILED_PIXELS}
 
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 os.makedirs(CACHE_FOLDER, exist_ok=True)
 
+# Indexed result cache
+CACHE_STORE = CacheStore(CACHE_FILE)
+# Byte/entry budgets of the cache folder, enforced on insert and by a sweeper
+CACHE_MANAGER = CacheManager(
+    CACHE_STORE,
+    CACHE_FOLDER,
+    max_bytes=int(os.environ.get('CACHE_MAX_MB', 1024)) * 1024 * 1024,
+    max_entries=int(os.environ.get('CACHE_MAX_ENTRIES', 10000)),
+    policy=os.environ.get('CACHE_POLICY', 'lru'),
+    upload_folder=UPLOAD_FOLDER,
+    lock_folder=LOCK_FOLDER,
+    sweep_interval=float(os.environ.get('CACHE_SWEEP_SECONDS', 300)),
+)
+
+# /compress/batch requests running at once in this worker, each with its own
+# process pool outside JOB_QUEUE_DEPTH
+BATCH_SLOTS = threading.BoundedSemaphore(int(os.environ.get('BATCH_CONCURRENCY', 1)))
+
+# One compression per cache key across threads and gunicorn workers
+SINGLE_FLIGHT = SingleFlight(LOCK_FOLDER)
+
+# SVD factors of recent uploads, so /recompress only reconstructs. The .svd
+# files in FACTOR_FOLDER are shared by all gunicorn and job workers.
+FACTOR_CACHE = FactorCache(
+    max_bytes=int(os.environ.get('FACTOR_CACHE_MB', 512)) * 1024 * 1024,
+    max_entries=int(os.environ.get('FACTOR_CACHE_ENTRIES', 32)),
+    disk_dir=FACTOR_FOLDER,
+    max_disk_bytes=int(os.environ.get('FACTOR_DISK_MB', 1024)) * 1024 * 1024,
+)
+
+# Bytes of recently served outputs, so moving the result page slider back
+# and forth does not read the same previews from disk again
+HOT_CACHE = HotCache(
+    max_bytes=int(os.environ.get('HOT_CACHE_MB', 64)) * 1024 * 1024,
+    max_item_bytes=int(os.environ.get('HOT_CACHE_ITEM_MB', 4)) * 1024 * 1024,
+)
+# Content-named outputs never change, so browsers may keep them this long
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+# Asynchronous compressions; identical in-flight requests share one job. Job
+# states live in jobs.db, so any gunicorn worker can answer /jobs/<id>
+JOB_MANAGER = JobManager(
+    os.path.join(CACHE_FOLDER, "jobs.db"),
+    max_workers=default_workers(),
+    max_queue=int(os.environ.get('JOB_QUEUE_DEPTH', 16)),
+    factor_dir=FACTOR_FOLDER,
+)
+
 app = Flask(__name__, static_folder=os.path.join(os.path.dirname(__file__), 'static'), template_folder=os.path.join(os.path.dirname(__file__), 'templates'))
 
 # Production-ready configuration
@@ -26,16 +107,92 @@ app.config["CACHE_FOLDER"] = CACHE_FOLDER
 app.config["CACHE_FILE"] = CACHE_FILE
 # Limit uploads to 32 MB (Azure limit)
 app.config["MAX_CONTENT_LENGTH"] = 32 * 1024 * 1024
+# Uploads up to this size are decoded from memory instead of re-read from disk
+app.config["UPLOAD_IN_MEMORY_LIMIT"] = 32 * 1024 * 1024
+# Zip archives in one /compress/batch request may expand to at most this much
+app.config["BATCH_MAX_EXTRACT_BYTES"] = int(os.environ.get('BATCH_MAX_EXTRACT_MB', 512)) * 1024 * 1024
+# /ready turns 503 at this many concurrent compressions in one worker (one
+# less than the gunicorn threads, so a thread is left for probes), below
+# this much free temp disk (MB), or when the cache exceeds its byte budget
+# by this factor (eviction is failing)
+app.config["READY_MAX_INFLIGHT"] = int(os.environ.get('READY_MAX_INFLIGHT', 3))
+app.config["READY_MIN_FREE_MB"] = int(os.environ.get('READY_MIN_FREE_MB', 512))
+app.config["READY_CACHE_OVERSHOOT"] = float(os.environ.get('READY_CACHE_OVERSHOOT', 1.5))
+# Read by the health probes instead of probing the filesystem
+app.extensions['job_manager'] = JOB_MANAGER
+app.extensions['cache_manager'] = CACHE_MANAGER
+
+# Production logging configuration; LOG_LEVEL=DEBUG shows per-request details
+logging.basicConfig(level=os.environ.get('LOG_LEVEL', 'DEBUG' if app.debug else 'INFO').upper())
+logger = logging.getLogger(__name__)
+
+RESULT_CACHE = metrics.counter("result_cache_requests_total", "Result cache lookups by outcome")
+CACHE_SECONDS = metrics.histogram("result_cache_seconds", "Time of result cache lookups and saves")
+
+# Register health check and metrics blueprints
+app.register_blueprint(health_bp)
+app.register_blueprint(metrics_bp)
+
+CACHE_MANAGER.start()
+
+
+def parse_rank_target(form) -> tuple:
+    """Read the optional ``energy`` (percent) and ``psnr`` (dB) form fields.
+
+    Raises:
+        ValueError: If a field is present but not a number in range.
+    """
+    energy = form.get('energy') or None
+    target_psnr = form.get('psnr') or None
+    if energy is not None:
+        energy = float(energy) / 100
+        if not 0 < energy <= 1:
+            raise ValueError('energy must be in (0, 100]')
+    if target_psnr is not None:
+        target_psnr = float(target_psnr)
+        if target_psnr <= 0:
+            raise ValueError('psnr must be positive')
+    return energy, target_psnr
+
+
+def parse_color_space(form) -> str:
+    """Read the optional ``color`` form field (``rgb`` or ``ycbcr``).
+
+    Raises:
+        ValueError: If the field names an unknown color space.
+    """
+    color_space = (form.get('color') or 'rgb').lower()
+    if color_space not in COLOR_SPACES:
+        raise ValueError(f"color must be one of {', '.join(COLOR_SPACES)}")
+    return color_space
+
+
+def lookup_cached(cache_key: str):
+    """Return the cache entry for cache_key if its output file still exists, or None.
+
+    The output is served from the cache folder itself, nothing is copied.
+    """
+    with CACHE_SECONDS.time(op="lookup"):
+        cached_result = CACHE_STORE.get(cache_key)
+        if cached_result is None:
+            return None
+        cached_file_path = os.path.join(app.config["CACHE_FOLDER"], cached_result["output_filename"])
+        if not os.path.exists(cached_file_path):
+            return None
+        return cached_result
 
-# Production logging configuration
-if not app.debug:
-    logging.basicConfig(level=logging.INFO)
 
-# Register health check blueprint
-app.register_blueprint(health_bp)
+def store_result(cache_key: str, result: tuple) -> dict:
+    """Move a compress_image result into the cache, where /preview serves it."""
+    out_path, runtime, before_size, after_size, height, width, ranks = result
+    with CACHE_SECONDS.time(op="save"):
+        cache_entry = cache_result(CACHE_STORE, app.config["CACHE_FOLDER"], cache_key, result)
+
+    logger.debug("h=%d, w=%d, before=%d, after=%d, ratio=%s",
+                 height, width, before_size, after_size, cache_entry['ratio_str'])
 
-cleanup_old_files(UPLOAD_FOLDER, max_age_hours=24)
-cleanup_old_files(CACHE_FOLDER, max_age_hours=48)
+    CACHE_MANAGER.evict()
+    return cache_entry
 
 
 @app.route("/")
@@ -62,101 +219,186 @@ def compress():
 
     filename = secure_filename(file.filename)
     in_path = os.path.join(app.config["UPLOAD_FOLDER"], filename)
-    file.save(in_path)
+    # Hash while streaming to disk; small uploads stay in memory for decoding
+    file_hash, data = save_upload(file.stream, in_path, app.config["UPLOAD_IN_MEMORY_LIMIT"])
 
     preset = request.form.get('preset', 'low')
     k = int(request.form.get('k', 100))
+    try:
+        energy, target_psnr = parse_rank_target(request.form)
+        color_space = parse_color_space(request.form)
+    except ValueError as e:
+        flash(f"Parameter tidak valid: {e}")
+        return redirect(url_for("index"))
 
-    file_hash = get_file_hash(in_path)
-    algorithm_version = "v2_adaptive"
-    cache_key = f"{file_hash}_{k}_{algorithm_version}"
-    
-    cache_data = load_cache(app.config["CACHE_FILE"])
-    
-    if cache_key in cache_data:
-        print(f"Cache hit for {cache_key}")
-        cached_result = cache_data[cache_key]
-        
-        cached_file_path = os.path.join(app.config["CACHE_FOLDER"], cached_result["output_filename"])
-        if os.path.exists(cached_file_path):
-            dest_path = os.path.join(app.config["UPLOAD_FOLDER"], cached_result["output_filename"])
-            shutil.copy2(cached_file_path, dest_path)
-            
-            return render_template(
-                "result.html",
-                before_fname=os.path.basename(in_path),
-                after_fname=cached_result["output_filename"],
-                runtime=f"{cached_result['runtime']:.3f} (cached)",
-                ratio=cached_result["ratio_str"],
-                dimension=cached_result["dimension"],
-                before_size_kb=cached_result["before_size_kb"],
-                after_size_kb=cached_result["after_size_kb"],
-                k=k,
-                preset=preset if preset else 'custom',
-            )
-
-    print(f"Cache miss for {cache_key} - performing compression")
-    (out_path, runtime, before_size, after_size, height, width) = compress_image(in_path, k)
-
-    after_basename = os.path.basename(out_path)
-    cache_file_path = os.path.join(app.config["CACHE_FOLDER"], after_basename)
-    shutil.copy2(out_path, cache_file_path)
+    cache_key = make_cache_key(file_hash, k, energy, target_psnr, color_space, MAX_PSNR_LOSS,
+                               TILED_PIXELS)
     
-    dest_path = os.path.join(app.config["UPLOAD_FOLDER"], after_basename)
-    try:
-        shutil.move(out_path, dest_path)
-    except Exception:
-        dest_path = out_path
-
-    ratio = (before_size - after_size) / before_size * 100
-    ratio_str = f"{ratio:.2f}%" if ratio >=0 else f"+{abs(ratio):.2f}% (lebih besar)"
-
-    print(f"DEBUG: h={height}, w={width}, k={k}")
-    print(f"DEBUG: before={before_size}, after={after_size}, ratio={(before_size-after_size)/before_size*100:.2f}%")
-
-    cache_entry = {
-        "output_filename": after_basename,
-        "runtime": runtime,
-        "ratio_str": ratio_str,
-        "dimension": f"{height}×{width}",
-        "before_size_kb": f"{before_size / 1024:.2f}",
-        "after_size_kb": f"{after_size / 1024:.2f}",
-        "timestamp": time.time()
-    }
+    cached_result = lookup_cached(cache_key)
     
-    cache_data[cache_key] = cache_entry
-    save_cache(app.config["CACHE_FILE"], cache_data)
+    if cached_result is not None:
+        RESULT_CACHE.inc(result="hit")
+        logger.info("Cache hit for %s", cache_key)
+        return render_template(
+            "result.html",
+            before_fname=os.path.basename(in_path),
+            after_fname=cached_result["output_filename"],
+            runtime=f"{cached_result['runtime']:.3f} (cached)",
+            ratio=cached_result["ratio_str"],
+            dimension=cached_result["dimension"],
+            before_size_kb=cached_result["before_size_kb"],
+            after_size_kb=cached_result["after_size_kb"],
+            k=k,
+            preset=preset if preset else 'custom',
+        )
+
+    RESULT_CACHE.inc(result="miss")
+    logger.info("Cache miss for %s - performing compression", cache_key)
+    with INFLIGHT.track():
+        cache_entry = SINGLE_FLIGHT.do(
+            cache_key,
+            lambda: store_result(cache_key, compress_image(
+                in_path, k, factor_cache=FACTOR_CACHE, cache_key=file_hash, data=data,
+                energy=energy, target_psnr=target_psnr, color_space=color_space,
+                **COMPRESS_OPTIONS)),
+            lookup=lambda: lookup_cached(cache_key),
+        )
 
     return render_template(
         "result.html",
         before_fname=os.path.basename(in_path),
-        after_fname=os.path.basename(dest_path),
-        runtime=f"{runtime:.3f}",
-        ratio=ratio_str,
-        dimension=f"{height}×{width}",
-        before_size_kb=f"{before_size / 1024:.2f}",
-        after_size_kb=f"{after_size / 1024:.2f}",
+        after_fname=cache_entry["output_filename"],
+        runtime=f"{cache_entry['runtime']:.3f}",
+        ratio=cache_entry["ratio_str"],
+        dimension=cache_entry["dimension"],
+        before_size_kb=cache_entry["before_size_kb"],
+        after_size_kb=cache_entry["after_size_kb"],
         k=k,
         preset=preset if preset else 'custom',
     )
 
 
+@app.route("/compress/batch", methods=["POST"])
+def compress_batch_route():
+    """Compress several images, or the images in a zip, and stream back a zip.
+
+    Form fields: ``images`` (any number of image or .zip files), ``k`` and
+    the optional ``energy``/``psnr`` targets and ``color`` of ``/compress``. The response
+    holds one JPEG per image plus a ``manifest.json`` with per-file results.
+    """
+    files = [f for f in request.files.getlist("images") if f.filename]
+    if not files:
+        return jsonify({'error': 'no files uploaded'}), 400
+    try:
+        k = int(request.form.get('k', 50))
+        energy, target_psnr = parse_rank_target(request.form)
+        color_space = parse_color_space(request.form)
+    except ValueError as e:
+        return jsonify({'error': f'invalid parameter: {e}'}), 400
+
+    # Each batch runs its own process pool, so only a few may run at once
+    if not BATCH_SLOTS.acquire(blocking=False):
+        return jsonify({'error': 'Server busy: too many batches running'}), 503
+    batch_dir = tempfile.mkdtemp(prefix="batch_", dir=app.config["UPLOAD_FOLDER"])
+    items = []
+    remaining = app.config["BATCH_MAX_EXTRACT_BYTES"]
+    error = None
+    try:
+        for i, file in enumerate(files):
+            filename = secure_filename(file.filename)
+            if filename.lower().endswith(".zip"):
+                extracted = list(extract_zip(file.stream, os.path.join(batch_dir, str(i)), remaining))
+                remaining -= sum(os.path.getsize(path) for _, path in extracted)
+                items.extend(extracted)
+            elif allowed_file(filename):
+                path = os.path.join(batch_dir, f"{i}_{filename}")
+                save_upload(file.stream, path, 0)
+                items.append((filename, path))
+    except zipfile.BadZipFile:
+        error = ({'error': 'invalid zip archive'}, 400)
+    except ArchiveTooLarge as e:
+        error = ({'error': str(e)}, 413)
+    except Exception:
+        shutil.rmtree(batch_dir, ignore_errors=True)
+        BATCH_SLOTS.release()
+        raise
+    if error is None and not items:
+        error = ({'error': 'no supported images found'}, 400)
+    if error is not None:
+        shutil.rmtree(batch_dir, ignore_errors=True)
+        BATCH_SLOTS.release()
+        return jsonify(error[0]), error[1]
+    logger.info("Batch of %d images, k=%d", len(items), k)
+
+    def stream():
+        try:
+            with INFLIGHT.track():
+                records = compress_batch(items, k, CACHE_STORE, app.config["CACHE_FOLDER"],
+                                         default_workers(), CACHE_MANAGER, energy=energy,
+                                         target_psnr=target_psnr, color_space=color_space,
+                                         **COMPRESS_OPTIONS)
+                yield from zip_results(records)
+        finally:
+            shutil.rmtree(batch_dir, ignore_errors=True)
+
+    response = Response(stream(), mimetype='application/zip',
+                        headers={'Content-Disposition': 'attachment; filename=svd_batch.zip'})
+    # Also runs when the client leaves before the stream starts
+    response.call_on_close(BATCH_SLOTS.release)
+    return response
+
+
+def send_output(fname: str, as_attachment: bool):
+    """Send a cached output or an upload, answering conditional and range requests.
+
+    Cached outputs are named by the hash of their content, so their URL is
+    immutable: they are sent with that hash as ETag and a one-year
+    ``Cache-Control: immutable``, from ``HOT_CACHE`` when possible. Uploads
+    and outputs cached before content naming may change under their name
+    and are revalidated on every use. A matching If-None-Match gets an
+    empty 304 either way. An output evicted while it is being looked up
+    is a 404, as if it had never been cached.
+    """
+    cache_path = safe_join(app.config["CACHE_FOLDER"], fname)
+    if cache_path is not None and os.path.isfile(cache_path) and not fname.endswith(CACHE_METADATA_SUFFIXES):
+        name = os.path.basename(fname)
+        stem = os.path.splitext(name)[0]
+        if len(stem) != BLOB_NAME_CHARS:
+            return send_file(cache_path, as_attachment=as_attachment, conditional=True)
+        if request.if_none_match.contains(stem):
+            # The name is the content, nothing needs to be read
+            response = Response(status=304)
+            response.set_etag(stem)
+        else:
+            try:
+                data = HOT_CACHE.get(cache_path)
+                source = io.BytesIO(data) if data is not None else cache_path
+                response = send_file(source, as_attachment=as_attachment, download_name=name, etag=stem,
+                                     last_modified=os.path.getmtime(cache_path),
+                                     max_age=IMMUTABLE_MAX_AGE, conditional=True)
+            except FileNotFoundError:
+                # Evicted since the isfile check above
+                return "File not found", 404
+        response.cache_control.public = True
+        response.cache_control.max_age = IMMUTABLE_MAX_AGE
+        response.cache_control.immutable = True
+        return response
+    upload_path = safe_join(app.config["UPLOAD_FOLDER"], fname)
+    if upload_path is not None and os.path.isfile(upload_path):
+        return send_file(upload_path, as_attachment=as_attachment, conditional=True)
+    return "File not found", 404
+
+
 @app.route("/download/<path:fname>")
 def download(fname):
     """Serve compressed file for download."""
-    path = os.path.join(app.config["UPLOAD_FOLDER"], fname)
-    if not os.path.exists(path):
-        return "File not found", 404
-    return send_file(path, as_attachment=True)
+    return send_output(fname, as_attachment=True)
 
 
 @app.route("/preview/<path:fname>")
 def preview(fname):
     """Serve file inline for preview in browser."""
-    path = os.path.join(app.config["UPLOAD_FOLDER"], fname)
-    if not os.path.exists(path):
-        return "File not found", 404
-    return send_file(path, as_attachment=False)
+    return send_output(fname, as_attachment=False)
 
 
 @app.route('/recompress', methods=['POST'])
@@ -164,63 +406,354 @@ def recompress():
     """Ajax endpoint to recompress original image with a new k value."""
     fname = request.form.get('fname')  # original uploaded filename
     k_val = request.form.get('k')
+    ks_val = request.form.get('ks')
     
-    print(f"DEBUG: Recompress called with fname={fname}, k={k_val}")
+    logger.debug("Recompress called with fname=%s, k=%s, ks=%s", fname, k_val, ks_val)
     
+    if fname and ks_val:
+        return recompress_sweep(fname, ks_val)
     if not fname or not k_val:
         return jsonify({'error': 'Parameter missing'}), 400
     try:
         k = int(k_val)
     except ValueError:
         return jsonify({'error': 'k must be int'}), 400
+    try:
+        energy, target_psnr = parse_rank_target(request.form)
+        color_space = parse_color_space(request.form)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
 
     orig_path = os.path.join(app.config['UPLOAD_FOLDER'], fname)
     if not os.path.exists(orig_path):
         return jsonify({'error': 'file not found'}), 404
 
     try:
-        # Compress again - FORCE no cache
-        out_path, runtime, before_size, after_size, height, width = compress_image(orig_path, k)
-        
-        print(f"DEBUG: SVD result - before:{before_size}, after:{after_size}, h:{height}, w:{width}")  # Debug log
-        
-        # ensure file reachable via preview route
-        dest_basename = os.path.basename(out_path)
-        dest_path = os.path.join(app.config['UPLOAD_FOLDER'], dest_basename)
-        try:
-            shutil.move(out_path, dest_path)
-        except Exception as e:
-            print(f"DEBUG: Move failed: {e}")
-            dest_path = out_path
-
-        ratio = (before_size - after_size) / before_size * 100
-
-        print(f"DEBUG: Recompress result - ratio:{ratio:.2f}%")  # Debug log
+        # Going through the result cache gives every k a content-named URL,
+        # so returning to a k the browser has seen needs no request at all
+        file_hash = get_file_hash(orig_path)
+        cache_key = make_cache_key(file_hash, k, energy, target_psnr, color_space, MAX_PSNR_LOSS,
+                                   TILED_PIXELS)
+        entry = lookup_cached(cache_key)
+        RESULT_CACHE.inc(result="miss" if entry is None else "hit")
+        if entry is None:
+            # Reuse the factors of the first decomposition, only k changes
+            with INFLIGHT.track():
+                result = compress_image(
+                    orig_path, k, factor_cache=FACTOR_CACHE, cache_key=file_hash,
+                    energy=energy, target_psnr=target_psnr, color_space=color_space,
+                    **COMPRESS_OPTIONS)
+            entry = store_result(cache_key, result)
+
+        logger.debug("Recompress result - before:%s KB, after:%s KB, ratio:%s",
+                     entry['before_size_kb'], entry['after_size_kb'], entry['ratio_str'])
 
         return jsonify({
-            'url': url_for('preview', fname=os.path.basename(dest_path)),
+            'url': url_for('preview', fname=entry['output_filename']),
             'k': k,
-            'runtime': f"{runtime:.3f}",
-            'before_kb': f"{before_size/1024:.2f}",
-            'after_kb': f"{after_size/1024:.2f}",
-            'ratio': f"{ratio:.2f}",
-            'dimension': f"{height}×{width}",
+            'ranks': entry.get('ranks'),
+            'runtime': f"{entry['runtime']:.3f}",
+            'before_kb': entry['before_size_kb'],
+            'after_kb': entry['after_size_kb'],
+            'ratio': entry['ratio_str'],
+            'dimension': entry['dimension'],
         })
-        
+
     except Exception as e:
-        print(f"ERROR in recompress: {e}")  # Error log
+        logger.exception("Recompress failed: %s", e)
         return jsonify({'error': f'Compression failed: {str(e)}'}), 500
 
 
+@app.route('/stream/<path:fname>')
+def stream_preview(fname):
+    """Server-sent events with successively sharper previews up to rank k.
+
+    Query parameters: ``k`` (final rank, default 100) and optionally
+    ``steps``, a comma separated list of intermediate ranks. Each event holds
+    the rank, a JPEG data URL and the seconds elapsed since the request.
+
+    Only factors already in ``FACTOR_CACHE`` are streamed. Otherwise the
+    answer is 204, which stops the EventSource: the result page sends
+    /recompress at the same time, and decomposing here as well would run
+    the same SVD twice.
+    """
+    try:
+        k = int(request.args.get('k', 100))
+        steps = [int(s) for s in request.args.get('steps', '').split(',') if s.strip()] or STREAM_STEPS
+    except ValueError:
+        return jsonify({'error': 'k and steps must be int'}), 400
+    orig_path = os.path.join(app.config['UPLOAD_FOLDER'], secure_filename(fname))
+    if not os.path.exists(orig_path):
+        return jsonify({'error': 'file not found'}), 404
+    start = time.time()
+    ranks = [s for s in steps if 0 < s < k] + [max(1, k)]
+    factors = FACTOR_CACHE.get(get_file_hash(orig_path), k)
+    if factors is None:
+        return Response(status=204)
+    U, S, Vt = factors
+
+    def stream():
+        with INFLIGHT.track():
+            for rank, pixels in progressive_reconstruct(U, S, Vt, ranks):
+                buf = io.BytesIO()
+                Image.fromarray(pixels).save(buf, format="JPEG", quality=80)
+                event = {
+                    'k': rank,
+                    'image': "data:image/jpeg;base64," + base64.b64encode(buf.getvalue()).decode("ascii"),
+                    'elapsed': round(time.time() - start, 3),
+                    'final': rank >= min(k, S.shape[-1]),
+                }
+                yield f"data: {json.dumps(event)}\n\n"
+
+    return Response(stream(), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache'})
+
+
+@app.route('/export/<path:fname>')
+def export_svd(fname):
+    """Download the truncated factors of an uploaded image as an .svd file.
+
+    Query parameters: ``k`` (rank, default 50), ``quant`` (int8, float16 or
+    float32) and ``codec`` (zlib, lzma or none).
+    """
+    quant = request.args.get('quant', 'int8')
+    codec = request.args.get('codec', 'zlib')
+    try:
+        k = int(request.args.get('k', 50))
+    except ValueError:
+        return jsonify({'error': 'k must be int'}), 400
+    if k < 1 or quant not in QUANTS or codec not in CODECS:
+        return jsonify({'error': 'invalid k, quant or codec'}), 400
+
+    orig_path = os.path.join(app.config['UPLOAD_FOLDER'], secure_filename(fname))
+    if not os.path.exists(orig_path):
+        return jsonify({'error': 'file not found'}), 404
+
+    try:
+        with INFLIGHT.track():
+            U, S, Vt = load_factors(orig_path, k, factor_cache=FACTOR_CACHE,
+                                    cache_key=get_file_hash(orig_path))
+        out_name = f"{os.path.splitext(secure_filename(fname))[0]}_k{k}_{quant}.svd"
+        out_path = os.path.join(app.config['UPLOAD_FOLDER'], out_name)
+        size = write_svd(out_path, U, S, Vt, k=k, quant=quant, codec=codec)
+        logger.debug("Exported %s, %d bytes", out_name, size)
+    except Exception as e:
+        logger.exception("Export failed: %s", e)
+        return jsonify({'error': f'Export failed: {str(e)}'}), 500
+    return send_file(out_path, as_attachment=True, mimetype='application/octet-stream')
+
+
+def recompress_sweep(fname: str, ks_val: str):
+    """Answer /recompress for a comma separated list of k with one decomposition.
+
+    Each k is looked up under the same cache key a single-k /recompress
+    uses, and only the ones not cached are compressed, together. The sweep
+    only covers fixed ranks in RGB, so ``energy``, ``psnr`` and ``color``
+    are refused instead of being ignored.
+    """
+    form = request.form
+    if form.get('energy') or form.get('psnr') or (form.get('color') or 'rgb').lower() != 'rgb':
+        return jsonify({'error': 'ks cannot be combined with energy, psnr or color'}), 400
+    try:
+        ks = [int(k) for k in ks_val.split(',') if k.strip()]
+    except ValueError:
+        return jsonify({'error': 'ks must be a comma separated list of int'}), 400
+    if not ks or min(ks) < 1:
+        return jsonify({'error': 'ks must contain positive values'}), 400
+
+    orig_path = os.path.join(app.config['UPLOAD_FOLDER'], secure_filename(fname))
+    if not os.path.exists(orig_path):
+        return jsonify({'error': 'file not found'}), 404
+
+    try:
+        start = time.time()
+        file_hash = get_file_hash(orig_path)
+        ks = sorted(set(ks))
+        keys = {k: make_cache_key(file_hash, k, None, None, 'rgb', MAX_PSNR_LOSS, TILED_PIXELS) for k in ks}
+        entries = {k: lookup_cached(keys[k]) for k in ks}
+        missing = [k for k in ks if entries[k] is None]
+        RESULT_CACHE.inc(len(ks) - len(missing), result="hit")
+        RESULT_CACHE.inc(len(missing), result="miss")
+        if missing:
+            with INFLIGHT.track():
+                sweep = compress_sweep(orig_path, missing, factor_cache=FACTOR_CACHE, cache_key=file_hash,
+                                       **COMPRESS_OPTIONS)
+            by_rank = {result[6][0]: result for result in sweep}
+            max_rank = min(sweep[0][4:6])
+            stored = {}
+            for k in missing:
+                rank = min(k, max_rank)
+                if rank not in stored:
+                    stored[rank] = store_result(keys[k], by_rank[rank])
+                # Every k above the image's rank shares one output
+                entries[k] = stored[rank]
+        results = []
+        for k, entry in entries.items():
+            results.append({
+                'url': url_for('preview', fname=entry['output_filename']),
+                'k': k,
+                'runtime': f"{entry['runtime']:.3f}",
+                'before_kb': entry['before_size_kb'],
+                'after_kb': entry['after_size_kb'],
+                'ratio': entry['ratio_str'],
+                'dimension': entry['dimension'],
+            })
+        return jsonify({'results': results, 'runtime': f"{time.time() - start:.3f}"})
+    except Exception as e:
+        logger.exception("Recompress sweep failed: %s", e)
+        return jsonify({'error': f'Compression failed: {str(e)}'}), 500
+
+
+def job_urls(job_id: str) -> dict:
+    """Status and event-stream URLs of a job."""
+    return {
+        'job_id': job_id,
+        'status_url': url_for('job_status', job_id=job_id),
+        'events_url': url_for('job_events', job_id=job_id),
+    }
+
+
+def save_job_input(stream, ext: str) -> tuple:
+    """Save the input of a job under the hash of its content.
+
+    A queued job opens its input only when a worker picks it up. Under a
+    content-derived name, a later upload with the same filename cannot
+    replace the bytes the job's cache key was computed from.
+
+    Returns:
+        in_path: ``UPLOAD_FOLDER/<sha256><ext>``.
+        file_hash: SHA-256 hex digest of the input.
+    """
+    fd, tmp_path = tempfile.mkstemp(suffix=ext, dir=app.config["UPLOAD_FOLDER"])
+    os.close(fd)
+    file_hash, _ = save_upload(stream, tmp_path, 0)
+    in_path = os.path.join(app.config["UPLOAD_FOLDER"], f"{file_hash}{ext}")
+    # Same name means same bytes, so replacing a file a job reads is harmless
+    os.replace(tmp_path, in_path)
+    return in_path, file_hash
+
+
+def submit_compress_job(in_path: str, file_hash: str, k: int, energy: float = None,
+                        target_psnr: float = None, color_space: str = "rgb"):
+    """Queue a compression of in_path, or answer from the result cache.
+
+    ``fname`` in the response names the saved input for /jobs/recompress.
+    """
+    cache_key = make_cache_key(file_hash, k, energy, target_psnr, color_space, MAX_PSNR_LOSS,
+                               TILED_PIXELS)
+    cached_result = lookup_cached(cache_key)
+    if cached_result is not None:
+        RESULT_CACHE.inc(result="hit")
+        job_id = JOB_MANAGER.add_finished(cache_key, dict(cached_result, k=k, cached=True))
+        return jsonify(dict(job_urls(job_id), fname=os.path.basename(in_path))), 200
+    RESULT_CACHE.inc(result="miss")
+
+    def on_done(payload):
+        result, samples = payload
+        metrics.REGISTRY.replay(samples)
+        return dict(store_result(cache_key, result), k=k, cached=False)
+
+    try:
+        job_id = JOB_MANAGER.submit(cache_key, compress_job, in_path, k,
+                                    cache_key=file_hash, on_done=on_done,
+                                    energy=energy, target_psnr=target_psnr,
+                                    color_space=color_space, **COMPRESS_OPTIONS)
+    except QueueFull as e:
+        return jsonify({'error': f'Server busy: {e}'}), 503
+    return jsonify(dict(job_urls(job_id), fname=os.path.basename(in_path))), 202
+
+
+@app.route('/jobs', methods=['POST'])
+def submit_job():
+    """Queue a compression of an uploaded image and return its job id at once."""
+    file = request.files.get('image')
+    if file is None or file.filename == '' or not allowed_file(file.filename):
+        return jsonify({'error': 'image missing or unsupported type'}), 400
+    try:
+        k = int(request.form.get('k', 100))
+        energy, target_psnr = parse_rank_target(request.form)
+        color_space = parse_color_space(request.form)
+    except ValueError as e:
+        return jsonify({'error': f'invalid parameter: {e}'}), 400
+
+    in_path, file_hash = save_job_input(file.stream, os.path.splitext(secure_filename(file.filename))[1].lower())
+    return submit_compress_job(in_path, file_hash, k, energy, target_psnr, color_space)
+
+
+@app.route('/jobs/recompress', methods=['POST'])
+def submit_recompress_job():
+    """Queue a recompression of an already uploaded image with a new k."""
+    fname = request.form.get('fname')
+    try:
+        k = int(request.form.get('k', ''))
+        energy, target_psnr = parse_rank_target(request.form)
+        color_space = parse_color_space(request.form)
+    except ValueError as e:
+        return jsonify({'error': f'invalid parameter: {e}'}), 400
+    if not fname:
+        return jsonify({'error': 'Parameter missing'}), 400
+
+    orig_path = os.path.join(app.config['UPLOAD_FOLDER'], secure_filename(fname))
+    if not os.path.exists(orig_path):
+        return jsonify({'error': 'file not found'}), 404
+    # Snapshot the upload, its name may be reused before the job runs
+    with open(orig_path, 'rb') as f:
+        in_path, file_hash = save_job_input(f, os.path.splitext(orig_path)[1].lower())
+    return submit_compress_job(in_path, file_hash, k, energy, target_psnr, color_space)
+
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    """Current status, stage and progress of a job."""
+    job = JOB_MANAGER.get(job_id)
+    if job is None:
+        return jsonify({'error': 'job not found'}), 404
+    if job['status'] == 'done':
+        job['result'] = dict(job['result'], url=url_for('preview', fname=job['result']['output_filename']))
+    return jsonify(job)
+
+
+@app.route('/jobs/<job_id>/events')
+def job_events(job_id):
+    """Server-sent events with the job status until it finishes."""
+    if JOB_MANAGER.get(job_id) is None:
+        return jsonify({'error': 'job not found'}), 404
+    preview_url = url_for('preview', fname='')
+
+    def stream():
+        last = None
+        while True:
+            job = JOB_MANAGER.get(job_id)
+            if job is None:
+                return
+            if job['status'] == 'done':
+                job['result'] = dict(job['result'], url=preview_url + job['result']['output_filename'])
+            if job != last:
+                yield f"data: {json.dumps(job)}\n\n"
+                last = job
+            if job['status'] in ('done', 'failed'):
+                return
+            time.sleep(0.25)
+
+    return Response(stream(), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache'})
+
+
 @app.route('/cache/clear', methods=['POST'])
 def clear_cache():
     """Clear all cached files and data."""
     try:
-        # Clear cache folder
+        # Clear cache folder, the index itself stays open in every worker
+        CACHE_STORE.clear()
         if os.path.exists(app.config["CACHE_FOLDER"]):
-            shutil.rmtree(app.config["CACHE_FOLDER"])
-            os.makedirs(app.config["CACHE_FOLDER"], exist_ok=True)
-        
+            for entry in os.scandir(app.config["CACHE_FOLDER"]):
+                if entry.name.endswith(CACHE_METADATA_SUFFIXES):
+                    continue
+                if entry.is_dir():
+                    shutil.rmtree(entry.path)
+                else:
+                    os.remove(entry.path)
+        FACTOR_CACHE.clear()
+        HOT_CACHE.clear()
+
         return jsonify({'success': True, 'message': 'Cache cleared successfully'})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
@@ -229,20 +762,16 @@ def clear_cache():
 @app.route('/cache/stats')
 def cache_stats():
     """Get cache statistics."""
-    cache_data = load_cache(app.config["CACHE_FILE"])
-    total_entries = len(cache_data)
-    
-    cache_size = 0
-    if os.path.exists(app.config["CACHE_FOLDER"]):
-        for dirpath, dirnames, filenames in os.walk(app.config["CACHE_FOLDER"]):
-            for filename in filenames:
-                filepath = os.path.join(dirpath, filename)
-                cache_size += os.path.getsize(filepath)
+    cache_size, total_entries = get_cache_size(CACHE_STORE)
     
     return jsonify({
         'total_entries': total_entries,
         'cache_size_mb': f"{cache_size / (1024*1024):.2f}",
-        'cache_folder': app.config["CACHE_FOLDER"]
+        'cache_folder': app.config["CACHE_FOLDER"],
+        'budget': CACHE_MANAGER.usage(),
+        'jobs': JOB_MANAGER.stats(),
+        'factor_cache': FACTOR_CACHE.stats(),
+        'hot_cache': HOT_CACHE.stats(),
     })
 
 
@@ -0,0 +1,313 @@
+"""
+Batch compression of many images on a process pool, with zip output
+
+Usage:
+    python batch.py INPUT OUTPUT [-k 50] [--ycbcr] [--tile-size PX] [--workers N] [--cache-dir DIR]
+
+INPUT is a directory (walked recursively) or a .zip archive. OUTPUT is a
+.zip file or a directory. Results are shared with the web app's cache, so
+images compressed before with the same k are not compressed again. The
+cache is kept within the same byte and entry budget as the web app's
+(CACHE_MAX_MB, CACHE_MAX_ENTRIES, CACHE_POLICY, or --cache-max-mb and
+--cache-max-entries).
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Iterable, Iterator, Tuple
+
+from werkzeug.utils import secure_filename
+
+from cache_manager import CacheManager
+from cache_store import CacheStore
+from svd import DOWNSCALE_MAX_LOSS_DB, MEMMAP_MIN_PIXELS, TILED_MIN_PIXELS, compress_image
+from utils import CHUNK_SIZE, allowed_file, cache_result, get_file_hash, make_cache_key
+
+
+def iter_images(root: str) -> Iterator[Tuple[str, str]]:
+    """Yield (relative name, path) of the supported images below root, sorted."""
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            if allowed_file(filename):
+                path = os.path.join(dirpath, filename)
+                yield os.path.relpath(path, root).replace(os.sep, "/"), path
+
+
+class ArchiveTooLarge(ValueError):
+    """Raised when a zip archive would extract to more than the allowed size."""
+
+
+def extract_zip(archive, dest_dir: str, max_bytes: int = None) -> Iterator[Tuple[str, str]]:
+    """Extract the supported images of a zip archive into dest_dir one by one.
+
+    Member names are sanitised per path component, so entries such as
+    ``../x.jpg`` cannot escape dest_dir. With ``max_bytes`` set, the
+    uncompressed sizes of the images are added up before anything is
+    written, and an archive above the limit raises ``ArchiveTooLarge``.
+    ``ZipFile`` stops reading a member at its recorded size, so a
+    member cannot expand past it.
+
+    Yields:
+        (name inside the archive, extracted path)
+    """
+    with zipfile.ZipFile(archive) as zf:
+        members = [info for info in zf.infolist() if not info.is_dir() and allowed_file(info.filename)]
+        total = sum(info.file_size for info in members)
+        if max_bytes is not None and total > max_bytes:
+            raise ArchiveTooLarge(f"archive expands to {total} bytes, limit is {max_bytes}")
+        for info in members:
+            parts = [secure_filename(part) for part in info.filename.split("/")]
+            name = "/".join(part for part in parts if part)
+            if not name:
+                continue
+            path = os.path.join(dest_dir, *name.split("/"))
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with zf.open(info) as src, open(path, "wb") as dst:
+                shutil.copyfileobj(src, dst, CHUNK_SIZE)
+            yield name, path
+
+
+def _compress_one(path: str, k: int, kwargs: dict) -> tuple:
+    return compress_image(path, k, **kwargs)
+
+
+def _lookup(cache_store, cache_folder: str, cache_key: str):
+    if cache_store is None:
+        return None
+    entry = cache_store.get(cache_key)
+    if entry is None:
+        return None
+    path = os.path.join(cache_folder, entry["output_filename"])
+    return (path, entry) if os.path.exists(path) else None
+
+
+def compress_batch(items: Iterable[Tuple[str, str]], k: int, cache_store=None,
+                   cache_folder: str = None, workers: int = None, cache_manager=None,
+                   **kwargs) -> Iterator[dict]:
+    """Compress (name, path) items on a process pool, yielding in completion order.
+
+    Cached results are yielded without compressing. Identical images within
+    the batch are compressed once. At most two images per worker are queued,
+    so ``items`` may be a lazy iterator over a very large input.
+
+    Args:
+        items: (name, path) pairs, e.g. from ``iter_images``.
+        k: Rank passed to ``compress_image``.
+        cache_store: Optional ``CacheStore`` shared with the web app.
+        cache_folder: Folder holding the cached images of cache_store.
+        workers: Pool size, defaults to the number of cores.
+        cache_manager: Optional ``CacheManager`` of cache_store; it evicts
+            after each new result, once that result's records were taken.
+        **kwargs: Further ``compress_image`` options (energy, target_psnr,
+            color_space, ...).
+
+    Yields:
+        Dicts with ``name``, ``path`` (output image, valid until the next
+        item is requested), ``cached``, and ``entry`` or ``error``.
+    """
+    workers = workers or os.cpu_count() or 1
+    pending = {}
+    waiting = {}
+
+    def finish(future):
+        cache_key, names = pending.pop(future)
+        del waiting[cache_key]
+        try:
+            result = future.result()
+        except Exception as e:
+            for name in names:
+                yield {"name": name, "path": None, "cached": False, "error": str(e)}
+            return
+        out_path = result[0]
+        if cache_store is not None:
+            # The output moves into the cache and is served from there
+            entry = cache_result(cache_store, cache_folder, cache_key, result)
+            for name in names:
+                yield {"name": name, "path": os.path.join(cache_folder, entry["output_filename"]),
+                       "cached": False, "entry": entry}
+            if cache_manager is not None:
+                cache_manager.evict()
+            return
+        entry = {"output_filename": os.path.basename(out_path), "runtime": result[1],
+                 "ranks": list(result[6])}
+        try:
+            for name in names:
+                yield {"name": name, "path": out_path, "cached": False, "entry": entry}
+        finally:
+            os.remove(out_path)
+
+    # spawn: the web app calling this runs threads, fork would copy them
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        for name, path in items:
+            cache_key = make_cache_key(get_file_hash(path), k, kwargs.get("energy"),
+                                       kwargs.get("target_psnr"), kwargs.get("color_space", "rgb"),
+                                       kwargs.get("max_psnr_loss"), kwargs.get("tiled_min_pixels"),
+                                       kwargs.get("tile_size"))
+            if cache_key in waiting:
+                pending[waiting[cache_key]][1].append(name)
+                continue
+            hit = _lookup(cache_store, cache_folder, cache_key)
+            if hit is not None:
+                yield {"name": name, "path": hit[0], "cached": True, "entry": hit[1]}
+                continue
+            future = pool.submit(_compress_one, path, k, kwargs)
+            pending[future] = (cache_key, [name])
+            waiting[cache_key] = future
+            while len(pending) >= 2 * workers:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield from finish(future)
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield from finish(future)
+
+
+class _ZipSink:
+    """Write-only file object that lets ZipFile output be streamed in pieces."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def take(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def zip_results(records: Iterable[dict]) -> Iterator[bytes]:
+    """Stream a zip of the compressed images plus a ``manifest.json``.
+
+    Each image is stored as ``<name without extension>.jpg``. JPEGs do not
+    shrink further, so members are stored uncompressed.
+    """
+    sink = _ZipSink()
+    manifest = []
+    used = set()
+    with zipfile.ZipFile(sink, "w", zipfile.ZIP_STORED) as zf:
+        for record in records:
+            item = {"name": record["name"], "cached": record["cached"]}
+            if record["path"] is not None:
+                arcname = os.path.splitext(record["name"])[0] + ".jpg"
+                stem, n = arcname[:-4], 1
+                while arcname in used:
+                    arcname = f"{stem}_{n}.jpg"
+                    n += 1
+                used.add(arcname)
+                zf.write(record["path"], arcname)
+                item.update(output=arcname, ranks=record["entry"].get("ranks"),
+                            ratio=record["entry"].get("ratio_str"))
+            else:
+                item["error"] = record["error"]
+            manifest.append(item)
+            yield sink.take()
+        zf.writestr("manifest.json", json.dumps(manifest, indent=2))
+    yield sink.take()
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Compress a directory or zip of images with SVD.")
+    parser.add_argument("input", help="directory or .zip archive of images")
+    parser.add_argument("output", help=".zip file or directory for the results")
+    parser.add_argument("-k", type=int, default=50, help="rank per channel (default 50)")
+    parser.add_argument("--energy", type=float, help="keep this percentage of spectral energy")
+    parser.add_argument("--psnr", type=float, help="smallest rank reaching this PSNR in dB")
+    parser.add_argument("--ycbcr", action="store_true",
+                        help="approximate luma at rank k and subsampled chroma at a lower rank")
+    parser.add_argument("--max-loss", type=float, default=0,
+                        help="PSNR in dB the downscaled fast path may lose, e.g. "
+                             f"{DOWNSCALE_MAX_LOSS_DB:g}; 0 (the default) disables it")
+    parser.add_argument("--memmap-megapixels", type=float, default=MEMMAP_MIN_PIXELS / 1e6,
+                        help="keep the float planes of images this large in a temporary file, "
+                             "0 disables it (default %(default)g)")
+    parser.add_argument("--tiled-megapixels", type=float, default=TILED_MIN_PIXELS / 1e6,
+                        help="compress images this large tile by tile, 0 disables it (default %(default)g)")
+    parser.add_argument("--tile-size", type=int,
+                        help="compress every image tile by tile with tiles of this many pixels")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--cache-dir", default=os.path.join(tempfile.gettempdir(), "svd_cache"),
+                        help="result cache shared with the web app")
+    parser.add_argument("--cache-max-mb", type=int, default=int(os.environ.get("CACHE_MAX_MB", 1024)),
+                        help="evict cached results beyond this many MB (default $CACHE_MAX_MB or 1024)")
+    parser.add_argument("--cache-max-entries", type=int,
+                        default=int(os.environ.get("CACHE_MAX_ENTRIES", 10000)),
+                        help="evict cached results beyond this many entries "
+                             "(default $CACHE_MAX_ENTRIES or 10000)")
+    parser.add_argument("--no-cache", action="store_true")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.WARNING, format="%(levelname)s %(message)s")
+
+    cache_store = cache_manager = None
+    if not args.no_cache:
+        os.makedirs(args.cache_dir, exist_ok=True)
+        cache_store = CacheStore(os.path.join(args.cache_dir, "cache.db"))
+        cache_manager = CacheManager(cache_store, args.cache_dir, args.cache_max_mb * 1024 * 1024,
+                                     args.cache_max_entries, policy=os.environ.get("CACHE_POLICY", "lru"))
+    kwargs = {}
+    if args.max_loss > 0:
+        kwargs["max_psnr_loss"] = args.max_loss
+    if args.memmap_megapixels > 0:
+        kwargs["memmap_min_pixels"] = int(args.memmap_megapixels * 1e6)
+    if args.tiled_megapixels > 0:
+        kwargs["tiled_min_pixels"] = int(args.tiled_megapixels * 1e6)
+    if args.tile_size:
+        kwargs["tile_size"] = args.tile_size
+    if args.ycbcr:
+        kwargs["color_space"] = "ycbcr"
+    if args.energy is not None:
+        kwargs["energy"] = args.energy / 100
+    if args.psnr is not None:
+        kwargs["target_psnr"] = args.psnr
+
+    start = time.time()
+    with tempfile.TemporaryDirectory() as extract_dir:
+        if zipfile.is_zipfile(args.input):
+            items = extract_zip(args.input, extract_dir)
+        else:
+            items = iter_images(args.input)
+        records = compress_batch(items, args.k, cache_store, args.cache_dir, args.workers,
+                                 cache_manager, **kwargs)
+
+        counts = {"done": 0, "cached": 0, "failed": 0}
+
+        def report(records):
+            for record in records:
+                status = "failed" if record["path"] is None else "cached" if record["cached"] else "done"
+                counts[status] += 1
+                print(f"{status:>6}  {record['name']}" + (f"  {record['error']}" if status == "failed" else ""))
+                yield record
+
+        if args.output.lower().endswith(".zip"):
+            with open(args.output, "wb") as f:
+                for chunk in zip_results(report(records)):
+                    f.write(chunk)
+        else:
+            for record in report(records):
+                if record["path"] is not None:
+                    dest = os.path.join(args.output, os.path.splitext(record["name"])[0] + ".jpg")
+                    os.makedirs(os.path.dirname(dest), exist_ok=True)
+                    shutil.copyfile(record["path"], dest)
+
+    print(f"{counts['done']} compressed, {counts['cached']} from cache, "
+          f"{counts['failed']} failed in {time.time() - start:.1f}s")
+    return 1 if counts["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,114 @@
+"""
+Budgeted eviction and background sweeping of the compression cache
+"""
+import logging
+import os
+import threading
+import time
+
+from utils import cleanup_old_files
+
+logger = logging.getLogger(__name__)
+
+# Rows checked for missing output files per sweep
+SWEEP_BATCH = 500
+
+
+class CacheManager:
+    """Keeps the cache folder within a byte and an entry budget.
+
+    Sizes come from the running counters in ``CacheStore``, so checking the
+    budget is O(1). When a budget is exceeded the least recently (``"lru"``)
+    or least frequently (``"lfu"``) used entries are removed together with
+    their files. A daemon thread repeats this every ``sweep_interval``
+    seconds. Each sweep also checks one batch of rows for missing files and
+    removes old uploads and stale single-flight lock files.
+    """
+
+    def __init__(self, cache_store, cache_folder: str, max_bytes: int, max_entries: int,
+                 policy: str = "lru", upload_folder: str = None,
+                 upload_max_age_hours: int = 24, lock_folder: str = None,
+                 sweep_interval: float = 300):
+        self.store = cache_store
+        self.cache_folder = cache_folder
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.policy = policy
+        self.upload_folder = upload_folder
+        self.upload_max_age_hours = upload_max_age_hours
+        self.lock_folder = lock_folder
+        self.sweep_interval = sweep_interval
+        self._cursor = 0
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def _unlink(self, output_filename: str) -> None:
+        try:
+            os.remove(os.path.join(self.cache_folder, output_filename))
+        except OSError:
+            pass
+
+    def _remove_entry(self, cache_key: str) -> int:
+        # The output goes with its last entry, in the same transaction
+        return 0 if self.store.delete(cache_key, unlink=self._unlink) is None else 1
+
+    def usage(self) -> dict:
+        """Current size and entry count against the budgets."""
+        total_bytes, total_entries = self.store.stats()
+        return {
+            'bytes': total_bytes,
+            'entries': total_entries,
+            'max_bytes': self.max_bytes,
+            'max_entries': self.max_entries,
+            'policy': self.policy,
+        }
+
+    def evict(self) -> int:
+        """Remove entries in eviction order until both budgets are met."""
+        removed = 0
+        with self._lock:
+            keys = []
+            while True:
+                total_bytes, total_entries = self.store.stats()
+                if total_bytes <= self.max_bytes and total_entries <= self.max_entries:
+                    break
+                if not keys:
+                    keys = self.store.eviction_candidates(32, self.policy)
+                    if not keys:
+                        break
+                removed += self._remove_entry(keys.pop(0))
+        if removed:
+            logger.info("Evicted %d cache entries", removed)
+        return removed
+
+    def sweep(self) -> int:
+        """One incremental maintenance pass, returns the number of removals."""
+        removed = 0
+        rows = self.store.page(self._cursor, SWEEP_BATCH)
+        # Wrap around once the end of the table is reached
+        self._cursor = rows[-1][0] if len(rows) == SWEEP_BATCH else 0
+        for _, cache_key, entry in rows:
+            if not os.path.exists(os.path.join(self.cache_folder, entry.get("output_filename", ""))):
+                self.store.delete(cache_key)
+                removed += 1
+        removed += self.evict()
+        if self.upload_folder:
+            removed += cleanup_old_files(self.upload_folder, self.upload_max_age_hours)
+        if self.lock_folder:
+            # No compression holds a lock anywhere near this long
+            removed += cleanup_old_files(self.lock_folder, max_age_hours=1)
+        return removed
+
+    def _run(self) -> None:
+        while True:
+            try:
+                self.sweep()
+            except Exception as e:
+                logger.exception("Error during cache sweep: %s", e)
+            time.sleep(self.sweep_interval)
+
+    def start(self) -> None:
+        """Start the background sweeper thread (once)."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="cache-sweeper", daemon=True)
+            self._thread.start()
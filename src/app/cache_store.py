@@ -0,0 +1,206 @@
+"""
+SQLite-backed index of compression results, one row per cache key
+"""
+import json
+import logging
+import sqlite3
+import threading
+import time
+from typing import Callable, Iterator, Optional, Tuple
+
+from sqlite_db import WALDatabase
+
+logger = logging.getLogger(__name__)
+
+# Hits are counted in memory and written at most this often per process
+ACCESS_FLUSH_SECONDS = 5.0
+
+
+class CacheStore(WALDatabase):
+    """Cache index shared safely between threads and gunicorn workers.
+
+    The database runs in WAL mode so readers never block the single writer,
+    and every insert is its own atomic transaction. Lookups hit the primary
+    key index instead of loading the whole cache. Entries are the same dicts
+    ``app.compress`` used to keep in ``cache.json``.
+
+    Each row also tracks the size of its output file, its last access time
+    and hit count. The total size and entry count are kept in a ``meta`` row
+    updated in the same transaction, so ``stats`` never scans the table.
+    Lookups only read: access times and hits are buffered per process and
+    written in one transaction every ``ACCESS_FLUSH_SECONDS``, and before
+    eviction picks its candidates.
+    """
+
+    def __init__(self, db_path: str):
+        super().__init__(db_path)
+        self._accesses = {}
+        self._accesses_lock = threading.Lock()
+        self._flushed = time.monotonic()
+        with self._write() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                " cache_key TEXT PRIMARY KEY,"
+                " output_filename TEXT NOT NULL,"
+                " timestamp REAL NOT NULL,"
+                " data TEXT NOT NULL)"
+            )
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(entries)")}
+            if "size_bytes" not in columns:
+                conn.execute("ALTER TABLE entries ADD COLUMN size_bytes INTEGER NOT NULL DEFAULT 0")
+                conn.execute("ALTER TABLE entries ADD COLUMN last_access REAL NOT NULL DEFAULT 0")
+                conn.execute("ALTER TABLE entries ADD COLUMN hits INTEGER NOT NULL DEFAULT 0")
+                conn.execute("UPDATE entries SET last_access = timestamp")
+            conn.execute("CREATE INDEX IF NOT EXISTS entries_last_access ON entries (last_access)")
+            conn.execute("CREATE INDEX IF NOT EXISTS entries_output ON entries (output_filename)")
+            conn.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+            conn.execute(
+                "INSERT OR IGNORE INTO meta SELECT 'total_bytes', COALESCE(SUM(size_bytes), 0) FROM entries"
+            )
+            conn.execute("INSERT OR IGNORE INTO meta SELECT 'total_entries', COUNT(*) FROM entries")
+
+    def _add_totals(self, conn: sqlite3.Connection, size_delta: int, count_delta: int) -> None:
+        conn.execute("UPDATE meta SET value = value + ? WHERE name = 'total_bytes'", (size_delta,))
+        conn.execute("UPDATE meta SET value = value + ? WHERE name = 'total_entries'", (count_delta,))
+
+    def get(self, cache_key: str) -> Optional[dict]:
+        """Return the entry stored under cache_key and mark it as used, or None."""
+        row = self._conn().execute(
+            "SELECT data FROM entries WHERE cache_key = ?", (cache_key,)
+        ).fetchone()
+        if row is None:
+            return None
+        with self._accesses_lock:
+            hits = self._accesses.get(cache_key, (0, 0))[1]
+            self._accesses[cache_key] = (time.time(), hits + 1)
+            due = time.monotonic() - self._flushed >= ACCESS_FLUSH_SECONDS
+        if due:
+            self.flush_accesses()
+        return json.loads(row[0])
+
+    def flush_accesses(self) -> None:
+        """Write the buffered access times and hit counts to the database."""
+        with self._accesses_lock:
+            accesses, self._accesses = self._accesses, {}
+            self._flushed = time.monotonic()
+        if not accesses:
+            return
+        try:
+            with self._write() as conn:
+                conn.executemany(
+                    "UPDATE entries SET last_access = MAX(last_access, ?), hits = hits + ? WHERE cache_key = ?",
+                    [(last, hits, key) for key, (last, hits) in accesses.items()],
+                )
+        except sqlite3.Error as e:
+            logger.warning("Could not record cache hits, retrying later: %s", e)
+            with self._accesses_lock:
+                for key, (last, hits) in accesses.items():
+                    newer, more = self._accesses.get(key, (0, 0))
+                    self._accesses[key] = (max(last, newer), hits + more)
+
+    def put(self, cache_key: str, entry: dict, size_bytes: int = 0,
+            place: Callable[[], object] = None) -> bool:
+        """Insert or replace the entry stored under cache_key.
+
+        Args:
+            cache_key: Key of the entry.
+            entry: Entry fields; must contain ``output_filename``.
+            size_bytes: Size of the cached output file, counted in the budget.
+            place: Called inside the write transaction before the row is
+                inserted, e.g. to move the output file into place. A
+                ``delete`` in another worker cannot unlink a shared output
+                between this call and the insert.
+        """
+        now = time.time()
+        try:
+            with self._write() as conn:
+                if place is not None:
+                    place()
+                old = conn.execute(
+                    "SELECT size_bytes FROM entries WHERE cache_key = ?", (cache_key,)
+                ).fetchone()
+                conn.execute(
+                    "INSERT OR REPLACE INTO entries"
+                    " (cache_key, output_filename, timestamp, data, size_bytes, last_access, hits)"
+                    " VALUES (?, ?, ?, ?, ?, ?, 0)",
+                    (cache_key, entry["output_filename"], entry.get("timestamp", now),
+                     json.dumps(entry), size_bytes, now),
+                )
+                if old is None:
+                    self._add_totals(conn, size_bytes, 1)
+                else:
+                    self._add_totals(conn, size_bytes - old[0], 0)
+            return True
+        except sqlite3.Error as e:
+            logger.error("Error saving cache: %s", e)
+            return False
+
+    def delete(self, cache_key: str,
+               unlink: Callable[[str], object] = None) -> Optional[dict]:
+        """Remove the entry stored under cache_key and return it, if any.
+
+        Outputs are named by content, so identical results of different
+        keys share one file. ``unlink(output_filename)`` is called only when
+        no entry references the output any more, inside the same write
+        transaction, so a concurrent ``put`` of that output cannot record
+        a file that is about to disappear.
+        """
+        with self._write() as conn:
+            row = conn.execute(
+                "SELECT data, size_bytes FROM entries WHERE cache_key = ?", (cache_key,)
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute("DELETE FROM entries WHERE cache_key = ?", (cache_key,))
+            self._add_totals(conn, -row[1], -1)
+            entry = json.loads(row[0])
+            if unlink is not None and not self.references(entry["output_filename"]):
+                unlink(entry["output_filename"])
+        return entry
+
+    def references(self, output_filename: str) -> int:
+        """Number of entries whose output is output_filename."""
+        row = self._conn().execute(
+            "SELECT COUNT(*) FROM entries WHERE output_filename = ?", (output_filename,)
+        ).fetchone()
+        return row[0]
+
+    def eviction_candidates(self, limit: int, policy: str = "lru") -> list:
+        """Return up to ``limit`` keys in eviction order.
+
+        ``"lru"`` orders by last access, ``"lfu"`` by hit count first.
+        """
+        self.flush_accesses()
+        order = "hits, last_access" if policy == "lfu" else "last_access"
+        rows = self._conn().execute(
+            f"SELECT cache_key FROM entries ORDER BY {order} LIMIT ?", (limit,)
+        ).fetchall()
+        return [row[0] for row in rows]
+
+    def page(self, after_rowid: int, limit: int) -> list:
+        """Return up to ``limit`` (rowid, cache_key, entry) rows after a rowid."""
+        rows = self._conn().execute(
+            "SELECT rowid, cache_key, data FROM entries WHERE rowid > ? ORDER BY rowid LIMIT ?",
+            (after_rowid, limit),
+        ).fetchall()
+        return [(rowid, key, json.loads(data)) for rowid, key, data in rows]
+
+    def stats(self) -> Tuple[int, int]:
+        """Return (total_bytes, total_entries) from the running counters."""
+        rows = dict(self._conn().execute("SELECT name, value FROM meta").fetchall())
+        return rows.get("total_bytes", 0), rows.get("total_entries", 0)
+
+    def items(self) -> Iterator[Tuple[str, dict]]:
+        """Iterate over all (cache_key, entry) pairs."""
+        rows = self._conn().execute("SELECT cache_key, data FROM entries").fetchall()
+        for cache_key, data in rows:
+            yield cache_key, json.loads(data)
+
+    def clear(self) -> None:
+        """Remove every entry."""
+        with self._write() as conn:
+            conn.execute("DELETE FROM entries")
+            conn.execute("UPDATE meta SET value = 0")
+
+    def __len__(self) -> int:
+        return self.stats()[1]
@@ -0,0 +1,210 @@
+"""
+In-memory store of SVD factors, backed by .svd files, so a new k only needs a reconstruction
+"""
+import contextlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+import numpy as np
+
+import metrics
+from similar import SimilarityIndex
+from svd_format import HEADER, SVDFormatError, payload_size, read_header, read_svd, write_svd
+
+logger = logging.getLogger(__name__)
+
+LOOKUPS = metrics.counter("factor_cache_lookups_total", "Factor cache lookups by the tier that answered")
+
+# Exact decompositions keep every singular triplet; anything above this rank
+# that was not asked for is dropped before storing. It is well above the
+# ranks the result page offers, so moving the slider keeps hitting the
+# cache, while max_bytes still bounds what one big photo can take.
+MAX_STORED_RANK = 1024
+
+
+def _stored_rank(path: str) -> int:
+    """Rank held by the uncompressed .svd file at path, 0 if it is unusable."""
+    try:
+        hdr = read_header(path)
+    except SVDFormatError:
+        return 0
+    if os.path.getsize(path) != HEADER.size + payload_size(hdr):
+        return 0
+    return hdr["rank"]
+
+
+class FactorCache:
+    """Bounded, least-recently-used store of per-image U, S, Vt factors.
+
+    Entries are keyed by the file hash from ``utils.get_file_hash`` and hold
+    stacked (c, m, r), (c, r), (c, r, n) factors. An entry can serve any
+    k up to its stored rank. Entries are evicted oldest-first once either
+    ``max_bytes`` or ``max_entries`` is exceeded.
+
+    With ``disk_dir`` set, every entry is also written there as an
+    uncompressed float16 ``.svd`` file. A memory miss then memory-maps that
+    file instead of decomposing again, which also shares factors between
+    processes. The oldest files are removed beyond ``max_disk_bytes``.
+    The perceptual hashes given to ``remember`` are indexed there too, so
+    ``nearest`` can offer the factors of a near-duplicate image.
+    """
+
+    def __init__(self, max_bytes: int = 512 * 1024 * 1024, max_entries: int = 32,
+                 max_rank: int = MAX_STORED_RANK, disk_dir: str = None,
+                 max_disk_bytes: int = 1024 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.max_rank = max_rank
+        self.disk_dir = disk_dir
+        self.max_disk_bytes = max_disk_bytes
+        self.index = None
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+            self.index = SimilarityIndex(os.path.join(disk_dir, "similar.db"))
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str, k: int) -> Optional[Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+        """Return factors of ``key`` that cover rank k, or None."""
+        if not key:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                U, S, Vt, nbytes = entry
+                max_rank = min(U.shape[-2], Vt.shape[-1])
+                if S.shape[-1] >= min(k, max_rank):
+                    self._entries.move_to_end(key)
+                    LOOKUPS.inc(result="memory")
+                    return U, S, Vt
+        factors = self._load(key, k)
+        LOOKUPS.inc(result="miss" if factors is None else "disk")
+        return factors
+
+    def path_for(self, key: str) -> str:
+        """Location of the on-disk copy of key's factors."""
+        return os.path.join(self.disk_dir, f"{key}.svd")
+
+    def _load(self, key: str, k: int):
+        if not self.disk_dir:
+            return None
+        path = self.path_for(key)
+        try:
+            hdr = read_header(path)
+            if hdr["rank"] < min(k, hdr["height"], hdr["width"]):
+                return None
+            U, S, Vt = read_svd(path)
+            os.utime(path)
+        except SVDFormatError as e:
+            # A corrupt file would otherwise fail every lookup and block rewrites
+            logger.warning("Removing corrupt factor file: %s", e)
+            with contextlib.suppress(OSError):
+                os.remove(path)
+            return None
+        except OSError:
+            return None
+        self.put(key, U, S, Vt, persist=False)
+        return U, S, Vt
+
+    def _persist(self, key: str, U: np.ndarray, S: np.ndarray, Vt: np.ndarray) -> None:
+        path = self.path_for(key)
+        try:
+            if os.path.exists(path) and _stored_rank(path) >= S.shape[-1]:
+                return
+            os.makedirs(self.disk_dir, exist_ok=True)
+            write_svd(path, U, S, Vt, quant="float16", codec="none")
+            files = [entry for entry in os.scandir(self.disk_dir) if entry.name.endswith(".svd")]
+            total = sum(entry.stat().st_size for entry in files)
+            for entry in sorted(files, key=lambda e: e.stat().st_mtime):
+                if total <= self.max_disk_bytes:
+                    break
+                total -= entry.stat().st_size
+                os.remove(entry.path)
+        except (OSError, SVDFormatError) as e:
+            logger.error("Error writing factor file: %s", e)
+
+    def put(self, key: str, U: np.ndarray, S: np.ndarray, Vt: np.ndarray,
+            persist: bool = True, min_rank: int = 0) -> None:
+        """Store factors of ``key``, replacing a lower-rank entry.
+
+        Factors beyond ``max_rank`` are dropped, except the first
+        ``min_rank``, which the caller is about to reconstruct from.
+        """
+        if not key:
+            return
+        keep = max(self.max_rank, min_rank)
+        if S.shape[-1] > keep:
+            U = U[..., :keep].copy()
+            S = S[..., :keep].copy()
+            Vt = Vt[..., :keep, :].copy()
+        if persist and self.disk_dir:
+            self._persist(key, U, S, Vt)
+        nbytes = U.nbytes + S.nbytes + Vt.nbytes
+        if nbytes > self.max_bytes:
+            return
+
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[3]
+                if old[1].shape[-1] > S.shape[-1]:
+                    # keep whichever entry covers more ranks
+                    U, S, Vt, nbytes = old
+            self._entries[key] = (U, S, Vt, nbytes)
+            self._bytes += nbytes
+            while self._entries and (self._bytes > self.max_bytes
+                                     or len(self._entries) > self.max_entries):
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted[3]
+
+    def remember(self, key: str, phash: int, height: int, width: int) -> None:
+        """Index the perceptual hash of the image whose factors are under key."""
+        if self.index is not None and key:
+            self.index.add(key, phash, height, width)
+
+    def nearest(self, phash: int, key: str = None):
+        """Factors of the closest indexed near-duplicate of an image, or None.
+
+        Args:
+            phash: ``similar.dhash`` of the image.
+            key: The image's own key, never returned.
+
+        Returns:
+            (neighbour key, U, S, Vt), or None.
+        """
+        if self.index is None:
+            return None
+        for other, distance, _, _ in self.index.find(phash, exclude=key):
+            factors = self.get(other, 1)
+            if factors is not None:
+                logger.debug("near-duplicate %s at distance %d", other, distance)
+                return (other,) + tuple(factors)
+            # The factors were trimmed from disk since
+            self.index.remove(other)
+        return None
+
+    def clear(self) -> None:
+        """Drop every stored entry, in memory and on disk."""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+        if self.index is not None:
+            self.index.clear()
+        if self.disk_dir and os.path.isdir(self.disk_dir):
+            for entry in os.scandir(self.disk_dir):
+                if entry.name.endswith(".svd"):
+                    os.remove(entry.path)
+
+    def stats(self) -> dict:
+        """Entry count and memory usage of the store."""
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'max_entries': self.max_entries,
+            }
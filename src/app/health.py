@@ -1,50 +1,111 @@
 """
-Health check endpoint for Azure App Service monitoring
+Health and readiness endpoints for Azure App Service monitoring
+
+Both probes answer from state the app already holds: the folders and
+limits in ``app.config`` and the job and cache managers registered in
+``app.extensions``. Disk and cache usage need a syscall or a SQLite read,
+so they are refreshed at most every ``READY_SNAPSHOT_SECONDS``.
 """
-from flask import Blueprint, jsonify
+from flask import Blueprint, current_app, jsonify
 import os
-import sys
+import shutil
+import threading
+import time
+
+import metrics
 
 health_bp = Blueprint('health', __name__)
 
+# Compressions running in this worker, maintained by the compress routes
+INFLIGHT = metrics.gauge("compressions_in_flight", "Compressions running in this worker")
+
+# Disk and cache usage are reused for this long between probes
+READY_SNAPSHOT_SECONDS = 2.0
+
+_snapshot = {'time': 0.0, 'value': None}
+_snapshot_lock = threading.Lock()
+
+
+def _usage_snapshot() -> dict:
+    """Free temp disk and cache budget usage, refreshed every few seconds."""
+    with _snapshot_lock:
+        now = time.monotonic()
+        if _snapshot['value'] is None or now - _snapshot['time'] > READY_SNAPSHOT_SECONDS:
+            folder = current_app.config["UPLOAD_FOLDER"]
+            try:
+                disk = shutil.disk_usage(folder)
+            except OSError:
+                disk = shutil.disk_usage(os.path.dirname(folder))
+            cache_manager = current_app.extensions.get('cache_manager')
+            _snapshot['value'] = {
+                'disk_free_mb': disk.free // (1024 * 1024),
+                'cache': cache_manager.usage() if cache_manager is not None else None,
+            }
+            _snapshot['time'] = now
+        return _snapshot['value']
+
+
+def load_report() -> dict:
+    """Current load of this worker and the reasons it should not take traffic."""
+    config = current_app.config
+    usage = _usage_snapshot()
+    job_manager = current_app.extensions.get('job_manager')
+    jobs = job_manager.stats() if job_manager is not None else None
+    inflight = int(INFLIGHT.value())
+
+    reasons = []
+    if inflight >= config["READY_MAX_INFLIGHT"]:
+        reasons.append(f"{inflight} compressions in flight (limit {config['READY_MAX_INFLIGHT']})")
+    if jobs is not None and jobs['inflight'] >= jobs['max_queue']:
+        reasons.append(f"job queue full ({jobs['inflight']}/{jobs['max_queue']})")
+    if usage['disk_free_mb'] < config["READY_MIN_FREE_MB"]:
+        reasons.append(f"{usage['disk_free_mb']} MB free in temp storage (minimum {config['READY_MIN_FREE_MB']})")
+    cache = usage['cache']
+    if cache is not None and cache['bytes'] > cache['max_bytes'] * config["READY_CACHE_OVERSHOOT"]:
+        reasons.append(f"cache at {cache['bytes'] / cache['max_bytes']:.0%} of its budget")
+
+    return {
+        'reasons': reasons,
+        'load': {
+            'inflight': inflight,
+            'max_inflight': config["READY_MAX_INFLIGHT"],
+            'jobs': jobs,
+            'disk_free_mb': usage['disk_free_mb'],
+            'cache': cache,
+        },
+    }
+
+
 @health_bp.route('/health')
 def health_check():
-    """Basic health check endpoint for Azure monitoring"""
-    try:
-        # Check if required modules can be imported
-        sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-        from svd import compress_image
-        from utils import allowed_file
-        
-        # Check if upload directories exist or can be created
-        upload_folder = os.environ.get('UPLOAD_FOLDER', '/tmp/svd_uploads')
-        cache_folder = os.environ.get('CACHE_FOLDER', '/tmp/svd_cache')
-        
-        os.makedirs(upload_folder, exist_ok=True)
-        os.makedirs(cache_folder, exist_ok=True)
-        
-        return jsonify({
-            'status': 'healthy',
-            'message': 'SVD Image Compression Service is running',
-            'checks': {
-                'imports': 'OK',
-                'directories': 'OK',
-                'upload_folder': upload_folder,
-                'cache_folder': cache_folder
-            }
-        }), 200
-        
-    except Exception as e:
-        return jsonify({
-            'status': 'unhealthy',
-            'message': f'Health check failed: {str(e)}',
-            'error': str(e)
-        }), 500
+    """Liveness: the worker answers and its folders are in place."""
+    config = current_app.config
+    folders = {name: os.path.isdir(config[name]) for name in ("UPLOAD_FOLDER", "CACHE_FOLDER")}
+    healthy = all(folders.values())
+    return jsonify({
+        'status': 'healthy' if healthy else 'unhealthy',
+        'message': 'SVD Image Compression Service is running' if healthy else 'Storage folder missing',
+        'checks': {
+            'upload_folder': config["UPLOAD_FOLDER"],
+            'cache_folder': config["CACHE_FOLDER"],
+            'directories': 'OK' if healthy else folders,
+        },
+        'load': load_report()['load'],
+    }), 200 if healthy else 500
+
 
 @health_bp.route('/ready')
 def readiness_check():
-    """Readiness check for Azure load balancer"""
+    """Readiness for the Azure load balancer: 503 while saturated."""
+    report = load_report()
+    if report['reasons']:
+        return jsonify({
+            'status': 'not_ready',
+            'message': '; '.join(report['reasons']),
+            'load': report['load'],
+        }), 503
     return jsonify({
         'status': 'ready',
-        'message': 'Service is ready to accept requests'
-    }), 200 
\ No newline at end of file
+        'message': 'Service is ready to accept requests',
+        'load': report['load'],
+    }), 200
@@ -0,0 +1,79 @@
+"""
+In-process store of the bytes of recently served outputs, so repeat previews skip the disk
+"""
+import logging
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+LOOKUPS = metrics.counter("hot_cache_lookups_total", "Output byte cache lookups by outcome")
+
+
+class HotCache:
+    """Bounded, least-recently-used map from output files to their bytes.
+
+    Only content-named outputs (see ``utils.store_blob``) are meant to be
+    kept here: their bytes never change under a name, so an entry is valid
+    for as long as the file exists. Files larger than ``max_item_bytes`` are
+    read from disk every time, so a few big outputs cannot push out the many
+    small previews. Entries are evicted oldest-first beyond ``max_bytes``.
+    """
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, max_item_bytes: int = 4 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.max_item_bytes = min(max_item_bytes, max_bytes)
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, path: str) -> Optional[bytes]:
+        """Bytes of the file at path, from memory if possible; None if too large.
+
+        Raises:
+            FileNotFoundError: The file is not cached and was removed, e.g.
+                evicted between the caller's check and this read.
+        """
+        with self._lock:
+            data = self._entries.get(path)
+            if data is not None:
+                self._entries.move_to_end(path)
+                LOOKUPS.inc(result="hit")
+                return data
+        try:
+            with open(path, "rb") as f:
+                data = f.read(self.max_item_bytes + 1)
+        except FileNotFoundError:
+            LOOKUPS.inc(result="missing")
+            raise
+        if len(data) > self.max_item_bytes:
+            LOOKUPS.inc(result="too_large")
+            return None
+        LOOKUPS.inc(result="miss")
+        with self._lock:
+            if path not in self._entries:
+                self._entries[path] = data
+                self._bytes += len(data)
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+        return data
+
+    def clear(self) -> None:
+        """Drop every entry."""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        """Entry count and memory usage of the store."""
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'max_item_bytes': self.max_item_bytes,
+            }
@@ -0,0 +1,313 @@
+"""
+Background compression jobs on a bounded process pool
+"""
+import json
+import logging
+import multiprocessing
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Optional, Tuple
+
+import metrics
+from factor_cache import FactorCache
+from sqlite_db import WALDatabase
+from svd import compress_image
+
+# Finished jobs are forgotten after this many seconds
+JOB_TTL_SECONDS = 3600
+
+logger = logging.getLogger(__name__)
+
+
+class QueueFull(Exception):
+    """Raised when the job queue already holds its maximum number of jobs."""
+
+
+_PUBLIC_FIELDS = ("id", "status", "stage", "progress", "result", "error")
+_IN_FLIGHT = ("queued", "running")
+
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class JobStore(WALDatabase):
+    """Job states in SQLite, shared by all gunicorn workers on the host.
+
+    Any worker can answer /jobs/<id> and coalesce a key queued by another
+    worker. Each in-flight job records the pid of the worker running it; a
+    job whose worker has exited is reported as failed instead of staying
+    queued forever. Like ``CacheStore`` the database runs in WAL mode and
+    read-then-write sequences take the write lock up front.
+    """
+
+    def __init__(self, db_path: str):
+        super().__init__(db_path)
+        with self._write() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                " id TEXT PRIMARY KEY,"
+                " key TEXT NOT NULL,"
+                " status TEXT NOT NULL,"
+                " stage TEXT NOT NULL,"
+                " progress REAL NOT NULL,"
+                " result TEXT,"
+                " error TEXT,"
+                " owner INTEGER NOT NULL,"
+                " created REAL NOT NULL,"
+                " finished REAL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_key ON jobs (key, status)")
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_finished ON jobs (finished)")
+
+    def _fail_orphans(self, conn: sqlite3.Connection, where: str, params: tuple) -> None:
+        rows = conn.execute(
+            f"SELECT id, owner FROM jobs WHERE {where} AND status IN ('queued', 'running')", params
+        ).fetchall()
+        for job_id, owner in rows:
+            if not _alive(owner):
+                conn.execute(
+                    "UPDATE jobs SET status = 'failed', stage = 'failed', error = ?, finished = ?"
+                    " WHERE id = ?", ("worker exited", time.time(), job_id),
+                )
+
+    def claim(self, key: str, create: bool = True) -> Tuple[Optional[str], bool]:
+        """Id of the in-flight job for key, or of a new queued job owned by this process.
+
+        Returns:
+            (job id, whether it was created). The id is None when nothing is
+            in flight and ``create`` is False.
+        """
+        with self._write() as conn:
+            self._fail_orphans(conn, "key = ?", (key,))
+            row = conn.execute(
+                "SELECT id FROM jobs WHERE key = ? AND status IN ('queued', 'running')"
+                " ORDER BY created LIMIT 1", (key,)
+            ).fetchone()
+            if row is not None:
+                return row[0], False
+            if not create:
+                return None, False
+            job_id = uuid.uuid4().hex
+            conn.execute(
+                "INSERT INTO jobs (id, key, status, stage, progress, owner, created)"
+                " VALUES (?, ?, 'queued', 'queued', 0, ?, ?)",
+                (job_id, key, os.getpid(), time.time()),
+            )
+            return job_id, True
+
+    def add_finished(self, key: str, result: dict) -> str:
+        """Record a job that is done already and return its id."""
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._write() as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, key, status, stage, progress, result, owner, created, finished)"
+                " VALUES (?, ?, 'done', 'done', 1, ?, ?, ?, ?)",
+                (job_id, key, json.dumps(result), os.getpid(), now, now),
+            )
+        return job_id
+
+    def progress(self, job_id: str, stage: str, fraction: float) -> None:
+        """Mark an in-flight job as running at stage."""
+        with self._write() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = 'running', stage = ?, progress = ?"
+                " WHERE id = ? AND status IN ('queued', 'running')", (stage, fraction, job_id),
+            )
+
+    def finish(self, job_id: str, result: dict = None, error: str = None) -> None:
+        """Record the result of a job, or its error when ``error`` is set."""
+        status = "failed" if error is not None else "done"
+        with self._write() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, stage = ?, progress = ?, result = ?, error = ?, finished = ?"
+                " WHERE id = ?",
+                (status, status, 1.0 if error is None else 0.0,
+                 json.dumps(result) if error is None else None, error, time.time(), job_id),
+            )
+
+    def get(self, job_id: str) -> Optional[dict]:
+        """Public fields of a job, or None if unknown."""
+        query = f"SELECT {', '.join(_PUBLIC_FIELDS)}, owner FROM jobs WHERE id = ?"
+        row = self._conn().execute(query, (job_id,)).fetchone()
+        if row is not None and row[1] in _IN_FLIGHT and not _alive(row[-1]):
+            with self._write() as conn:
+                self._fail_orphans(conn, "id = ?", (job_id,))
+                row = conn.execute(query, (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(zip(_PUBLIC_FIELDS, row[:-1]))
+        job["result"] = json.loads(job["result"]) if job["result"] is not None else None
+        return job
+
+    def prune(self, cutoff: float) -> None:
+        """Forget jobs that finished before cutoff."""
+        with self._write() as conn:
+            conn.execute("DELETE FROM jobs WHERE finished < ?", (cutoff,))
+
+    def __len__(self) -> int:
+        return self._conn().execute("SELECT COUNT(*) FROM jobs").fetchone()[0]
+
+
+# Per worker process state, set up by _init_worker
+_progress_queue = None
+_worker_factor_cache = None
+
+
+def _init_worker(progress_queue, factor_cache_bytes: int, factor_dir: str = None) -> None:
+    global _progress_queue, _worker_factor_cache
+    _progress_queue = progress_queue
+    _worker_factor_cache = FactorCache(max_bytes=factor_cache_bytes, disk_dir=factor_dir)
+
+
+def compress_job(job_id: str, input_path: str, k: int, cache_key: str = None, **kwargs) -> tuple:
+    """Run ``compress_image`` in a worker, reporting progress to the parent.
+
+    Returns:
+        The ``compress_image`` result and the metric samples recorded while
+        computing it, for ``metrics.REGISTRY.replay`` in the parent.
+    """
+    def report(stage: str, fraction: float) -> None:
+        _progress_queue.put((job_id, stage, fraction))
+
+    with metrics.capture() as samples:
+        result = compress_image(input_path, k, factor_cache=_worker_factor_cache,
+                                cache_key=cache_key, progress=report, **kwargs)
+    return result, samples
+
+
+class JobManager:
+    """Bounded queue of compression jobs with progress tracking.
+
+    Jobs run on a process pool of ``max_workers`` processes, started lazily
+    on the first submit. At most ``max_queue`` jobs may be queued or running
+    in this process at once. Job states live in a ``JobStore`` at
+    ``db_path``, so every gunicorn worker can report any job, and a key that
+    is already in flight in any worker returns the existing job instead of
+    starting a second one. Workers keep their own factor cache, backed by the
+    .svd files in ``factor_dir`` when given.
+    """
+
+    def __init__(self, db_path: str, max_workers: int = 1, max_queue: int = 16,
+                 factor_cache_bytes: int = 256 * 1024 * 1024, factor_dir: str = None):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.factor_cache_bytes = factor_cache_bytes
+        self.factor_dir = factor_dir
+        self.store = JobStore(db_path)
+        self._inflight = set()
+        self._lock = threading.Lock()
+        self._executor = None
+        self._progress_queue = None
+
+    def _start(self) -> None:
+        # spawn: the parent runs threads (cache sweeper), fork would copy them
+        ctx = multiprocessing.get_context("spawn")
+        if self._progress_queue is None:
+            self._progress_queue = ctx.Queue()
+            threading.Thread(target=self._drain_progress, name="job-progress", daemon=True).start()
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.max_workers,
+            mp_context=ctx,
+            initializer=_init_worker,
+            initargs=(self._progress_queue, self.factor_cache_bytes, self.factor_dir),
+        )
+
+    def _drain_progress(self) -> None:
+        while True:
+            job_id, stage, fraction = self._progress_queue.get()
+            try:
+                self.store.progress(job_id, stage, fraction)
+            except sqlite3.Error as e:
+                logger.error("Error saving job progress: %s", e)
+
+    def add_finished(self, key: str, result: dict) -> str:
+        """Record a job whose result is already known (e.g. a cache hit)."""
+        self.store.prune(time.time() - JOB_TTL_SECONDS)
+        return self.store.add_finished(key, result)
+
+    def submit(self, key: str, fn: Callable, *args,
+               on_done: Optional[Callable] = None, **kwargs) -> str:
+        """Queue ``fn(job_id, *args, **kwargs)`` unless ``key`` is in flight.
+
+        Args:
+            key: Identity of the work, e.g. the cache key (hash, k, version).
+            fn: Picklable top-level function run in a worker process.
+            on_done: Called in the parent with fn's return value; what it
+                returns becomes the job result.
+
+        Returns:
+            Id of the new or already running job.
+
+        Raises:
+            QueueFull: When ``max_queue`` jobs are already pending here.
+        """
+        self.store.prune(time.time() - JOB_TTL_SECONDS)
+        with self._lock:
+            job_id, created = self.store.claim(key, create=len(self._inflight) < self.max_queue)
+            if job_id is None:
+                raise QueueFull(f"{len(self._inflight)} jobs already queued")
+            if not created:
+                return job_id
+            try:
+                if self._executor is None:
+                    self._start()
+                try:
+                    future = self._executor.submit(fn, job_id, *args, **kwargs)
+                except BrokenProcessPool:
+                    # A worker died (e.g. killed for memory); start a fresh pool
+                    self._executor.shutdown(wait=False)
+                    self._start()
+                    future = self._executor.submit(fn, job_id, *args, **kwargs)
+            except Exception as e:
+                self.store.finish(job_id, error=str(e))
+                raise
+            self._inflight.add(job_id)
+
+        def finish(fut) -> None:
+            try:
+                result = fut.result()
+                if on_done is not None:
+                    result = on_done(result)
+                self.store.finish(job_id, result)
+            except Exception as e:
+                logger.error("Job %s failed: %s", job_id, e)
+                self.store.finish(job_id, error=str(e))
+            finally:
+                with self._lock:
+                    self._inflight.discard(job_id)
+
+        future.add_done_callback(finish)
+        return job_id
+
+    def get(self, job_id: str) -> Optional[dict]:
+        """Snapshot of a job's public fields, or None if unknown."""
+        return self.store.get(job_id)
+
+    def stats(self) -> dict:
+        """Queue depth of this process and limits."""
+        with self._lock:
+            inflight = len(self._inflight)
+        return {
+            "inflight": inflight,
+            "tracked": len(self.store),
+            "max_queue": self.max_queue,
+            "max_workers": self.max_workers,
+        }
+
+
+def default_workers() -> int:
+    """Worker count from JOB_WORKERS, defaulting to half the cores."""
+    return int(os.environ.get("JOB_WORKERS", max(1, (os.cpu_count() or 2) // 2)))
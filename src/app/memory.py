@@ -0,0 +1,50 @@
+"""
+Peak resident memory of this process, for per-request reporting
+
+Linux keeps the high-water mark of the resident set as VmHWM in
+/proc/self/status and resets it to the current RSS when "5" is written to
+/proc/self/clear_refs. Where that is not available the peak comes from
+``ru_maxrss``, which cannot be reset and so is the peak of the whole
+process lifetime.
+"""
+import resource
+import sys
+
+_STATUS = "/proc/self/status"
+_CLEAR_REFS = "/proc/self/clear_refs"
+
+
+def _status_bytes(field: str):
+    try:
+        with open(_STATUS) as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def reset_peak() -> bool:
+    """Start a new peak measurement; False if only the lifetime peak is available."""
+    try:
+        with open(_CLEAR_REFS, "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss() -> int:
+    """Highest resident set size in bytes since the last ``reset_peak``."""
+    peak = _status_bytes("VmHWM")
+    if peak is not None:
+        return peak
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return maxrss if sys.platform == "darwin" else maxrss * 1024
+
+
+def current_rss() -> int:
+    """Resident set size in bytes right now, or 0 if unknown."""
+    return _status_bytes("VmRSS") or 0
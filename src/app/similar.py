@@ -0,0 +1,130 @@
+"""
+Perceptual-hash index for finding near-duplicate images across uploads
+"""
+import logging
+import sqlite3
+
+import numpy as np
+from PIL import Image
+
+from sqlite_db import WALDatabase
+
+logger = logging.getLogger(__name__)
+
+# Largest Hamming distance between 64-bit hashes counted as a near-duplicate
+NEAR_DUPLICATE_DISTANCE = 6
+# The hash is split into this many bands; two hashes within distance
+# HASH_BANDS - 1 share at least one band exactly, so a band lookup finds them
+HASH_BANDS = 8
+
+
+def dhash(pixels: np.ndarray) -> int:
+    """64-bit difference hash of an (H, W, 3) uint8 image.
+
+    The image is shrunk to 9 x 8 grey pixels and each bit says whether a
+    pixel is brighter than its right neighbour. Re-encoding, resizing,
+    small edits and brightness changes flip few bits.
+    """
+    # Sampling every step-th pixel down to ~512 px skips converting the
+    # whole image and still averages out JPEG noise in the thumbnail
+    step = max(1, min(pixels.shape[:2]) // 512)
+    grey = Image.fromarray(np.ascontiguousarray(pixels[::step, ::step])).convert("L")
+    small = np.asarray(grey.resize((9, 8), Image.BOX), dtype=np.int16)
+    bits = (small[:, 1:] > small[:, :-1]).ravel()
+    return int(np.packbits(bits).view(">u8")[0])
+
+
+def hamming(a: int, b: int) -> int:
+    """Number of differing bits between two hashes."""
+    return bin(a ^ b).count("1")
+
+
+def _signed(value: int) -> int:
+    # SQLite integers are signed 64-bit
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def _bands(phash: int) -> list:
+    width = 64 // HASH_BANDS
+    mask = (1 << width) - 1
+    return [(band, (phash >> (band * width)) & mask) for band in range(HASH_BANDS)]
+
+
+class SimilarityIndex(WALDatabase):
+    """SQLite index from perceptual hashes to factor cache keys.
+
+    Each hash is stored once plus once per band, and a lookup only reads the
+    rows sharing a band with the query before comparing full hashes. Like
+    ``CacheStore`` the database runs in WAL mode and can be shared between
+    threads and processes.
+    """
+
+    def __init__(self, db_path: str):
+        super().__init__(db_path)
+        with self._write() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS hashes ("
+                " key TEXT PRIMARY KEY,"
+                " phash INTEGER NOT NULL,"
+                " height INTEGER NOT NULL,"
+                " width INTEGER NOT NULL)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS bands ("
+                " band INTEGER NOT NULL,"
+                " value INTEGER NOT NULL,"
+                " key TEXT NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS bands_lookup ON bands (band, value)")
+            conn.execute("CREATE INDEX IF NOT EXISTS bands_key ON bands (key)")
+
+    def add(self, key: str, phash: int, height: int, width: int) -> None:
+        """Record the hash and size of the image stored under key."""
+        try:
+            with self._write() as conn:
+                conn.execute("DELETE FROM bands WHERE key = ?", (key,))
+                conn.execute("INSERT OR REPLACE INTO hashes VALUES (?, ?, ?, ?)",
+                             (key, _signed(phash), height, width))
+                conn.executemany("INSERT INTO bands VALUES (?, ?, ?)",
+                                 [(band, value, key) for band, value in _bands(phash)])
+        except sqlite3.Error as e:
+            logger.error("Error indexing image hash: %s", e)
+
+    def find(self, phash: int, exclude: str = None,
+             max_distance: int = NEAR_DUPLICATE_DISTANCE) -> list:
+        """Indexed images within max_distance of phash, closest first.
+
+        Returns:
+            (key, distance, height, width) tuples, without ``exclude``.
+        """
+        clause = " OR ".join("(b.band = ? AND b.value = ?)" for _ in range(HASH_BANDS))
+        params = [x for pair in _bands(phash) for x in pair]
+        try:
+            rows = self._conn().execute(
+                "SELECT DISTINCT h.key, h.phash, h.height, h.width FROM bands b"
+                f" JOIN hashes h ON h.key = b.key WHERE {clause}", params,
+            ).fetchall()
+        except sqlite3.Error as e:
+            logger.error("Error reading image hashes: %s", e)
+            return []
+        matches = []
+        for key, stored, height, width in rows:
+            distance = hamming(phash, stored & ((1 << 64) - 1))
+            if key != exclude and distance <= max_distance:
+                matches.append((key, distance, height, width))
+        return sorted(matches, key=lambda m: m[1])
+
+    def remove(self, key: str) -> None:
+        """Forget the image stored under key."""
+        with self._write() as conn:
+            conn.execute("DELETE FROM bands WHERE key = ?", (key,))
+            conn.execute("DELETE FROM hashes WHERE key = ?", (key,))
+
+    def clear(self) -> None:
+        """Forget every image."""
+        with self._write() as conn:
+            conn.execute("DELETE FROM bands")
+            conn.execute("DELETE FROM hashes")
+
+    def __len__(self) -> int:
+        return self._conn().execute("SELECT COUNT(*) FROM hashes").fetchone()[0]
@@ -0,0 +1,86 @@
+"""
+Single-flight execution: one computation per key, shared by concurrent callers
+"""
+import os
+import threading
+from typing import Any, Callable, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows: only threads of one process are coalesced
+    fcntl = None
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Coalesce concurrent calls for the same key into one computation.
+
+    Within a process the first caller for a key (the leader) runs the work
+    and every other thread asking for that key waits for its result. When
+    ``lock_dir`` is given, the leader additionally holds an exclusive file
+    lock named after the key. A leader in another gunicorn worker then
+    blocks on that lock, and once it gets the lock it calls ``lookup`` to
+    pick up the finished result before running anything itself.
+    """
+
+    def __init__(self, lock_dir: str = None):
+        self.lock_dir = lock_dir
+        self._calls = {}
+        self._lock = threading.Lock()
+        if lock_dir:
+            os.makedirs(lock_dir, exist_ok=True)
+
+    def do(self, key: str, fn: Callable[[], Any],
+           lookup: Optional[Callable[[], Any]] = None) -> Any:
+        """Return fn()'s result for key, running fn at most once at a time.
+
+        Args:
+            key: Identity of the work, e.g. the cache key.
+            fn: Computes (and typically stores) the result.
+            lookup: Returns an already stored result or None; checked after
+                waiting for another worker's lock.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = self._run_locked(key, fn, lookup)
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+    def _run_locked(self, key: str, fn: Callable[[], Any],
+                    lookup: Optional[Callable[[], Any]]) -> Any:
+        if not self.lock_dir or fcntl is None:
+            return fn()
+        lock_path = os.path.join(self.lock_dir, f"{key}.lock")
+        with open(lock_path, "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                if lookup is not None:
+                    result = lookup()
+                    if result is not None:
+                        return result
+                return fn()
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
@@ -0,0 +1,49 @@
+"""
+Shared connection handling for the SQLite stores kept next to the cache
+"""
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Iterator
+
+
+class WALDatabase:
+    """Base for SQLite stores shared by threads and gunicorn workers.
+
+    The database runs in WAL mode so readers never block the single writer.
+    Each thread gets its own connection, since sqlite3 connections must not
+    be shared between threads. Subclasses create their tables in
+    ``__init__`` after calling this one.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # Autocommit mode; writes use explicit transactions in _write()
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _write(self) -> Iterator[sqlite3.Connection]:
+        """Run a block as one write transaction, taking the lock up front.
+
+        BEGIN IMMEDIATE makes read-then-write sequences atomic across
+        workers instead of failing when a deferred transaction upgrades.
+        """
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
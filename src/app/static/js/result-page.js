@@ -1,5 +1,6 @@
 const debounceDelay=400;
 let timer=null;
+let preview=null;
 const slider = document.getElementById('kSlider');
 const kLabel = document.getElementById('kVal');
 const img=document.getElementById('compressedImg');
@@ -11,24 +12,39 @@ if (slider) {
     slider.oninput = () => {
         kLabel.textContent = slider.value;
         if (timer) clearTimeout(timer);
-        timer = setTimeout(doRecompress, debounceDelay);
+        timer = setTimeout(() => { streamPreview(); doRecompress(); }, debounceDelay);
     };
 };
 
+// Show coarse previews while the final image is encoded; the server answers
+// 204 (ending the stream) until the factors of the image are cached
+function streamPreview(){
+    if (preview) preview.close();
+    preview = new EventSource(`/stream/${encodeURIComponent(origName)}?k=${slider.value}`);
+    preview.onmessage = (e) => {
+        const d = JSON.parse(e.data);
+        img.src = d.image;
+        if (d.final) { preview.close(); preview = null; }
+    };
+    preview.onerror = () => { preview.close(); preview = null; };
+}
+
 function doRecompress(){
     const fd=new FormData();
     fd.append('fname', origName);
-    fd.append('k', '{{ k }}');
+    fd.append('k', slider.value);
     fetch('/recompress', {method:'POST', body:fd})
         .then(r=>r.json()).then(d=>{
         if(d.error){console.error(d.error);return;}
-        img.src=d.url+'?'+Date.now();
+        if (preview) { preview.close(); preview = null; }
+        // Output URLs are content-named and immutable, revisited ks come from the browser cache
+        img.src=d.url;
         statsDiv.innerHTML=`<h4 class="font-bold mb-3">File Size Metrics</h4>
             <hr class="my-4">
             <p><strong>Image pixel size:</strong> ${d.dimension}</p>
             <p><strong>Original file size:</strong> ${d.before_kb} KB</p>
             <p><strong>Compressed file size:</strong> ${d.after_kb} KB</p>
-            <p><strong>File compression ratio:</strong> ${d.ratio}%</p>
+            <p><strong>File compression ratio:</strong> ${d.ratio}</p>
             
             <hr class="my-4">
             <p><strong>k value:</strong> ${d.k}</p>
@@ -1,68 +1,786 @@
+import io
+import logging
 import time
 import numpy as np
 from PIL import Image
 import os
 import tempfile
-from typing import Tuple
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Tuple
+
+import memory
+import metrics
+from similar import dhash
+
+logger = logging.getLogger(__name__)
+
+STAGE_SECONDS = metrics.histogram("svd_stage_seconds", "Time spent in each compress_image stage")
+ENCODE_ATTEMPT_SECONDS = metrics.histogram("svd_encode_attempt_seconds", "Time of one trial JPEG encode")
+ENCODE_ATTEMPTS = metrics.counter("svd_encode_attempts_total", "Trial JPEG encodes, including the final one")
+PEAK_RSS = metrics.histogram("compress_peak_rss_bytes", "Peak resident memory of the process during a compression",
+                             buckets=tuple(2 ** i * 1024 * 1024 for i in range(5, 14)))
 
 
 SUPPORTED_FORMATS = (".png", ".jpg", ".jpeg")
 
-def compress_image(input_path: str, k: int) -> Tuple[str, float, int, int, int, int]:
-    """Compress an RGB image using Singular Value Decomposition.
-    
-    This function implements an adaptive compression strategy that ensures
-    the output file is always smaller than the input file.
+SVD_METHODS = ("auto", "exact", "randomized", "lanczos")
+# Truncated backends only pay off when k is a small fraction of the rank
+RANDOMIZED_MAX_RATIO = 0.1
+# Below this size a full LAPACK decomposition is already fast enough
+RANDOMIZED_MIN_DIM = 256
+RANDOMIZED_OVERSAMPLE = 10
+# Extra factors decomposed past k when they go to a factor cache, so moving
+# the k slider up a little later is still served from the cache
+FACTOR_HEADROOM = 64
+# Relative change of the captured energy at which power iteration stops
+SVD_TOLERANCE = 1e-4
+
+
+def frobenius_sq(A: np.ndarray) -> np.ndarray:
+    """Squared Frobenius norm of each (m, n) matrix of A, accumulated in float64.
+
+    Works through row blocks so no float64 copy of A is ever made.
+    """
+    total = np.zeros(A.shape[:-2], dtype=np.float64)
+    for r0 in range(0, A.shape[-2], RECONSTRUCT_BLOCK_ROWS):
+        rows = A[..., r0:r0 + RECONSTRUCT_BLOCK_ROWS, :]
+        total += np.sum(np.square(rows, dtype=np.float64), axis=(-2, -1))
+    return total
+
+
+def choose_svd_method(k: int, shape: Tuple[int, ...]) -> str:
+    """Pick the SVD backend for a rank-k approximation of (..., m, n) matrices."""
+    max_rank = min(shape[-2:])
+    if max_rank >= RANDOMIZED_MIN_DIM and k / max_rank <= RANDOMIZED_MAX_RATIO:
+        return "randomized"
+    return "exact"
+
+
+def headroom_rank(k: int, max_rank: int) -> int:
+    """Rank to decompose at when the factors for k are cached for later ranks."""
+    return min(k + min(k, FACTOR_HEADROOM), max_rank)
+
+
+def _svd_exact(A: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray, bool]:
+    """Full (thin) LAPACK decomposition; all min(m, n) factors are returned."""
+    U, S, Vt = np.linalg.svd(A, full_matrices=False)
+    return U, S, Vt, True
+
+
+def _svd_randomized(A: np.ndarray, k: int, tol: float = SVD_TOLERANCE,
+                    min_iter: int = 2, max_iter: int = 8,
+                    start: np.ndarray = None) -> Tuple[np.ndarray, np.ndarray, np.ndarray, bool]:
+    """Randomized range-finder SVD (Halko et al.) with adaptive power iterations.
+
+    Works on a stack of matrices at once: every product and QR below is a
+    batched call over the leading axis. Power iterations run until the energy
+    captured by the sampled subspace changes by less than ``tol`` (relative)
+    for every matrix. The returned flag is False when that did not happen
+    within ``max_iter`` iterations.
+
+    ``start``, an (..., n, r) block, replaces the random test matrix, e.g.
+    to warm-start from the right singular vectors of a similar matrix.
+    """
+    m, n = A.shape[-2:]
+    At = np.swapaxes(A, -1, -2)
+    if start is not None:
+        omega = start.astype(A.dtype, copy=False)
+    else:
+        r = min(k + RANDOMIZED_OVERSAMPLE, m, n)
+        # Fixed seed so the same image and k always give the same output
+        rng = np.random.default_rng(0)
+        omega = rng.standard_normal((n, r)).astype(A.dtype)
+    Q, _ = np.linalg.qr(A @ omega)
+
+    converged = False
+    prev_energy = 0.0
+    for it in range(max_iter):
+        Bt = At @ Q
+        energy = np.sum(np.square(Bt, dtype=np.float64), axis=(-2, -1))
+        if it >= min_iter and np.all(energy - prev_energy <= tol * energy):
+            converged = True
+            break
+        prev_energy = energy
+        Z, _ = np.linalg.qr(Bt)
+        Q, _ = np.linalg.qr(A @ Z)
+    else:
+        Bt = At @ Q
+
+    Ub, S, Vt = np.linalg.svd(np.swapaxes(Bt, -1, -2), full_matrices=False)
+    U = Q @ Ub
+    return U[..., :k], S[..., :k], Vt[..., :k, :], converged
+
+
+def _svd_lanczos(A: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray, bool]:
+    """Truncated Lanczos SVD through scipy's ARPACK wrapper."""
+    from scipy.sparse.linalg import svds
+
+    if k >= min(A.shape[-2:]):
+        return _svd_exact(A, k)
+    if A.ndim > 2:
+        # ARPACK has no batched interface, decompose matrix by matrix
+        parts = [_svd_lanczos(a, k) for a in A]
+        return (np.stack([p[0] for p in parts]), np.stack([p[1] for p in parts]),
+                np.stack([p[2] for p in parts]), True)
+    U, S, Vt = svds(A, k=k)
+    # svds returns singular values in ascending order
+    order = np.argsort(S)[::-1]
+    return U[:, order], S[order], Vt[order], True
+
+
+_SVD_BACKENDS = {
+    "exact": _svd_exact,
+    "randomized": _svd_randomized,
+    "lanczos": _svd_lanczos,
+}
+
+
+def svd_factors(A: np.ndarray, k: int, method: str = "auto") -> Tuple[np.ndarray, np.ndarray, np.ndarray, str, np.ndarray]:
+    """Decompose a matrix, or a stack of matrices, with the requested backend.
 
     Args:
-        input_path: Full path to input image file.
-        k: Number of singular values to keep (per channel).
+        A: (m, n) matrix or (c, m, n) stack, ideally C-contiguous.
+        k: Rank that will be kept from the result.
+        method: One of ``SVD_METHODS``.
 
     Returns:
-        out_path: Path where compressed image is stored.
-        runtime: Compression runtime in seconds.
-        before_size: Original file size in bytes.
-        after_size: Compressed file size in bytes.
-        height: Image height (pixels).
-        width: Image width (pixels).
+        U, S, Vt: Factors holding at least k singular triplets, stacked like A.
+        method: Backend that actually produced the factors.
+        rel_error: Relative Frobenius error of each rank-k approximation.
     """
-    start = time.time()
+    if method not in SVD_METHODS:
+        raise ValueError(f"Unknown SVD method: {method}")
+    if method == "auto":
+        method = choose_svd_method(k, A.shape)
 
-    if not os.path.isfile(input_path):
-        raise FileNotFoundError(f"{input_path} tidak ditemukan.")
+    U, S, Vt, converged = _SVD_BACKENDS[method](A, k)
+    if not converged:
+        # The truncated result is not trustworthy, fall back to LAPACK
+        logger.warning("%s SVD did not converge, falling back to exact", method)
+        method = "exact"
+        U, S, Vt, _ = _svd_exact(A, k)
 
-    img = Image.open(input_path).convert("RGB")
-    arr = np.asarray(img, dtype=np.float32)
-    height, width, _ = arr.shape
-    before_size = os.path.getsize(input_path)
+    # ||A - A_k||_F^2 = ||A||_F^2 - sum(S[:k]^2) holds for every backend
+    # because A_k is an orthogonal projection of A
+    total = frobenius_sq(A)
+    kept = np.sum(np.square(S[..., :k], dtype=np.float64), axis=-1)
+    rel_error = np.sqrt(np.maximum(total - kept, 0.0) / np.where(total > 0, total, 1.0))
+    return U, S, Vt, method, rel_error
+
+
+# Downscale factors tried by the fast path, coarsest first
+DOWNSCALE_FACTORS = (8, 4)
+# The reduced image must keep this many pixels per rank on its short side
+DOWNSCALE_MIN_RATIO = 4
+# Suggested PSNR loss in dB the fast path may cost against the exact path
+# when it is turned on; callers leave it off unless asked for
+DOWNSCALE_MAX_LOSS_DB = 1.0
+
+
+def _downsample(A: np.ndarray, s: int) -> np.ndarray:
+    """Average s x s blocks of (..., m, n) matrices, dropping partial blocks."""
+    m, n = (d // s for d in A.shape[-2:])
+    # s^2 strided adds beat a mean over the reshaped block axes several times
+    out = np.zeros(A.shape[:-2] + (m, n), dtype=np.float32)
+    for i in range(s):
+        for j in range(s):
+            out += A[..., i:m * s:s, j:n * s:s]
+    out *= 1.0 / (s * s)
+    return out
+
+
+def _upsample_rows(M: np.ndarray, length: int, s: int) -> np.ndarray:
+    """Linearly interpolate (..., l, r) row samples at block centres to length rows."""
+    rows = M.shape[-2]
+    x = np.clip((np.arange(length) + 0.5) / s - 0.5, 0, rows - 1)
+    i0 = np.floor(x).astype(np.intp)
+    i1 = np.minimum(i0 + 1, rows - 1)
+    f = (x - i0).astype(M.dtype)[:, None]
+    return M[..., i0, :] * (1 - f) + M[..., i1, :] * f
+
+
+def svd_downscaled(A: np.ndarray, k: int, max_loss_db: float, method: str = "auto",
+                   rank: int = None):
+    """Rank-k factors of A found at reduced resolution, if provably close to exact.
+
+    For each factor s in ``DOWNSCALE_FACTORS`` the s x s block means of A
+    are decomposed, their right singular vectors interpolated back to full
+    width and refined with one pass over A (Q = orth(A V), then the SVD of
+    Q^T A), which yields orthonormal rank-k factors of A itself.
+
+    Block averaging has spectral norm 1/s per axis, so
+    sigma_i(A) >= s * sigma_i(A_small) and s^2 times the tail energy of the
+    small image bounds the squared error of the exact rank-k path from
+    below. A level is accepted when the refined error is within
+    ``max_loss_db`` of that bound, i.e. its PSNR is at most that much below
+    the exact path's. Otherwise the next finer level is tried.
+
+    With ``rank`` above k, that many vectors are carried through the
+    refinement and returned; the check still applies to the leading k,
+    which are at least as good as with k vectors since their span grows.
+
+    Returns:
+        (U, S, Vt, s, loss_bound_db), or None when no level qualifies.
+    """
+    m, n = A.shape[-2:]
+    rank = max(rank or k, k)
+    total = frobenius_sq(A)
+    for s in DOWNSCALE_FACTORS:
+        if min(m, n) // s < max(RANDOMIZED_MIN_DIM, DOWNSCALE_MIN_RATIO * k):
+            continue
+        small = _downsample(A, s)
+        _, S_small, Vt_small, _, _ = svd_factors(small, rank, method)
+        tail = (np.sum(np.square(small, dtype=np.float64), axis=(-2, -1))
+                - np.sum(np.square(S_small[..., :k], dtype=np.float64), axis=-1))
+        V = _upsample_rows(np.swapaxes(Vt_small[..., :rank, :], -1, -2), n, s)
+        Q, _ = np.linalg.qr(A @ V)
+        Ub, S, Vt = np.linalg.svd(np.swapaxes(Q, -1, -2) @ A, full_matrices=False)
+        error = np.sum(total - np.sum(np.square(S[..., :k], dtype=np.float64), axis=-1))
+        bound = s * s * np.sum(np.maximum(tail, 0.0))
+        eps = 1e-9 * np.sum(total) + 1e-12
+        loss_db = 10 * np.log10((max(error, 0.0) + eps) / (bound + eps))
+        logger.debug("downscale x%d: PSNR loss <= %.2f dB", s, loss_db)
+        if loss_db <= max_loss_db:
+            return Q @ Ub, S, Vt, s, float(loss_db)
+    return None
+
+
+def _resample_rows(M: np.ndarray, length: int) -> np.ndarray:
+    """Linearly stretch the rows of (..., l, r) matrices to length rows."""
+    rows = M.shape[-2]
+    if rows == length:
+        return M
+    x = np.linspace(0, rows - 1, length)
+    i0 = np.minimum(x.astype(np.intp), rows - 1)
+    i1 = np.minimum(i0 + 1, rows - 1)
+    f = (x - i0).astype(M.dtype)[:, None]
+    return M[..., i0, :] * (1 - f) + M[..., i1, :] * f
 
-    # Pastikan k tidak lebih besar dari dimensi minimum
-    max_rank = min(height, width)
-    k = max(1, min(k, max_rank))
-    
-    print(f"DEBUG: Original size: {before_size} bytes, k: {k}, max_rank: {max_rank}")
 
-    out_channels = []
-    for ch in range(3):
-        # U: (m, m); S: (m, n); Vt: (n, n) untuk full_matrices=True
-        U, S, Vt = np.linalg.svd(arr[:, :, ch], full_matrices=False)
-        S[k:] = 0  # buang singular value kecil
-        recon = np.matmul(U, np.matmul(np.diag(S), Vt))
-        out_channels.append(recon)
+def svd_warm_start(A: np.ndarray, k: int, Vt_seed: np.ndarray, max_iter: int = 8):
+    """Rank-k factors of A by subspace iteration from another image's Vt.
+
+    Meant for re-uploads of an edited, re-encoded or resized image whose
+    factors are cached: their right singular vectors, stretched to A's
+    width when it differs and topped up with random columns to the usual
+    oversampled width, replace the random start of ``_svd_randomized``.
+    The iteration stops on the same tolerance as a cold start, so the
+    result is as accurate; it just usually needs fewer passes.
+
+    Args:
+        A: (c, m, n) float32 planes.
+        k: Rank to compute.
+        Vt_seed: (c, r, n') right singular vectors of the similar image.
+
+    Returns:
+        (U, S, Vt), or None when the iteration did not converge.
+    """
+    m, n = A.shape[-2:]
+    width = min(k + RANDOMIZED_OVERSAMPLE, m, n)
+    seed = _resample_rows(np.swapaxes(Vt_seed[..., :width, :], -1, -2), n)
+    if seed.shape[-1] < width:
+        rng = np.random.default_rng(0)
+        extra = rng.standard_normal((n, width - seed.shape[-1])).astype(seed.dtype)
+        seed = np.concatenate([seed, np.broadcast_to(extra, seed.shape[:-2] + extra.shape)], axis=-1)
+    U, S, Vt, converged = _svd_randomized(A, k, min_iter=1, max_iter=max_iter, start=seed)
+    return (U, S, Vt) if converged else None
+
+
+# Rows reconstructed per matmul, keeps the float scratch small on big images
+RECONSTRUCT_BLOCK_ROWS = 512
+# Default image size from which float planes are file-backed (about 190 MB
+# of float32 RGB planes)
+MEMMAP_MIN_PIXELS = 16_000_000
+
+
+def load_pixels(input_path: str, data: bytes = None) -> np.ndarray:
+    """Decode an image to an (H, W, 3) uint8 array, holding a single decoded copy.
+
+    The PIL image is converted only when it is not RGB already and is
+    closed once its pixels are copied out.
+    """
+    with Image.open(io.BytesIO(data) if data is not None else input_path) as img:
+        if img.mode != "RGB":
+            img = img.convert("RGB")
+        pixels = np.asarray(img)
+        img.close()
+    return pixels
+
+
+def scratch_array(shape: Tuple[int, ...], memmap_min_pixels: int = None,
+                  scratch_dir: str = None) -> np.ndarray:
+    """Uninitialised float32 array, file-backed when its planes are large.
+
+    At or above ``memmap_min_pixels`` per (m, n) plane the array lives in
+    an unlinked temporary file in ``scratch_dir``. Its pages are then page
+    cache the kernel can write back and reclaim under memory pressure,
+    instead of anonymous memory that can only be OOM-killed. The file
+    disappears with the last reference to the array.
+    """
+    if memmap_min_pixels is None or shape[-2] * shape[-1] < memmap_min_pixels:
+        return np.empty(shape, dtype=np.float32)
+    with tempfile.TemporaryFile(dir=scratch_dir) as f:
+        return np.memmap(f, dtype=np.float32, mode="w+", shape=shape)
+
+
+def float_planes(pixels: np.ndarray, memmap_min_pixels: int = None) -> np.ndarray:
+    """(c, H, W) float32 planes of an (H, W, c) uint8 image, converted channel by channel."""
+    height, width, c = pixels.shape
+    planes = scratch_array((c, height, width), memmap_min_pixels)
+    for i in range(c):
+        np.copyto(planes[i], pixels[..., i])
+    return planes
+
+
+def reconstruct_rank_k(U: np.ndarray, S: np.ndarray, Vt: np.ndarray, k,
+                       out: np.ndarray) -> np.ndarray:
+    """Write the clipped rank-k approximation U[:, :k] S[:k] Vt[:k] into out.
+
+    Only the first k factors are touched and no diagonal matrix is built.
+    Rows are produced in blocks into one reusable float scratch buffer, then
+    clipped in place and cast straight into ``out``.
+
+    Args:
+        U, S, Vt: Factors stacked per channel: (c, m, r), (c, r), (c, r, n).
+        k: Rank of the approximation, or one rank per channel.
+        out: Preallocated (m, n, c) uint8 image.
+
+    Returns:
+        out, for convenience.
+    """
+    ks = np.asarray(k)
+    kmax = int(ks.max())
+    Sk = S[..., :kmax]
+    if ks.ndim:
+        # Zero the singular values beyond each channel's own rank
+        Sk = np.where(np.arange(kmax) < ks[:, None], Sk, 0).astype(S.dtype)
+    Us = U[..., :kmax] * Sk[..., None, :]
+    Vk = Vt[..., :kmax, :]
+    m = Us.shape[-2]
+    block = min(RECONSTRUCT_BLOCK_ROWS, m)
+    scratch = np.empty(Us.shape[:-2] + (block, Vk.shape[-1]), dtype=np.result_type(Us, Vk))
+    # (c, rows, n) view of the interleaved output
+    planes = np.moveaxis(out, -1, 0)
+    for r0 in range(0, m, block):
+        r1 = min(r0 + block, m)
+        buf = scratch[..., :r1 - r0, :]
+        np.matmul(Us[..., r0:r1, :], Vk, out=buf)
+        np.clip(buf, 0, 255, out=buf)
+        # unsafe cast truncates like astype(np.uint8) did
+        np.copyto(planes[..., r0:r1, :], buf, casting="unsafe")
+    return out
+
+
+def progressive_reconstruct(U: np.ndarray, S: np.ndarray, Vt: np.ndarray, ks):
+    """Yield (k, image) for increasing ranks, refining one float accumulator.
+
+    Each step only adds the rank-one terms between the previous rank and
+    the new one, so the total cost equals a single reconstruction at the
+    largest rank. The yielded uint8 (m, n, c) image is reused between steps;
+    copy it if it must outlive the next iteration.
+
+    Args:
+        U, S, Vt: Factors stacked per channel: (c, m, r), (c, r), (c, r, n).
+        ks: Ranks to emit; clamped to the stored rank and deduplicated.
+    """
+    c, m, _ = U.shape
+    n = Vt.shape[-1]
+    acc = np.zeros((c, m, n), dtype=np.float32)
+    out = np.empty((m, n, c), dtype=np.uint8)
+    planes = np.moveaxis(out, -1, 0)
+    block = min(RECONSTRUCT_BLOCK_ROWS, m)
+    scratch = np.empty((c, block, n), dtype=np.float32)
+    done = 0
+    for k in sorted({max(1, min(int(k), S.shape[-1])) for k in ks}):
+        Us = U[..., done:k] * S[..., None, done:k]
+        Vk = Vt[..., done:k, :]
+        for r0 in range(0, m, block):
+            r1 = min(r0 + block, m)
+            buf = scratch[..., :r1 - r0, :]
+            rows = acc[..., r0:r1, :]
+            np.matmul(Us[..., r0:r1, :], Vk, out=buf)
+            rows += buf
+            np.clip(rows, 0, 255, out=buf)
+            np.copyto(planes[..., r0:r1, :], buf, casting="unsafe")
+        done = k
+        yield k, out
+
+
+# Default edge length of tiles in block-wise mode
+TILE_SIZE = 256
+# Default image size from which compress_image switches to block-wise mode
+TILED_MIN_PIXELS = 50_000_000
+# Environment variables that cap the threads of the BLAS numpy links to
+BLAS_THREAD_VARS = ("OPENBLAS_NUM_THREADS", "OMP_NUM_THREADS", "MKL_NUM_THREADS")
+
+
+def tile_workers() -> int:
+    """Tile threads that leave each tile's BLAS calls their own cores.
+
+    Every tile's SVD runs multithreaded BLAS, by default on all cores, so
+    running tiles side by side only pays off once one of
+    ``BLAS_THREAD_VARS`` limits the BLAS threads per call.
+    """
+    cores = os.cpu_count() or 1
+    for name in BLAS_THREAD_VARS:
+        value = os.environ.get(name, "")
+        if value.isdigit() and int(value) > 0:
+            return max(1, cores // int(value))
+    return 1
+
+
+def rank_for_energy(S: np.ndarray, energy: float, total: np.ndarray = None) -> np.ndarray:
+    """Smallest rank per matrix whose singular values keep ``energy`` of the total.
+
+    Args:
+        S: (..., r) singular values in descending order.
+        energy: Fraction of spectral energy (sum of S^2) to keep, e.g. 0.99.
+        total: Total energy ||A||_F^2 per matrix; defaults to sum(S^2), which
+            is only correct when S holds the full spectrum.
+
+    Returns:
+        Integer array of ranks with the leading shape of S (at least 1).
+    """
+    cumulative = np.cumsum(np.square(S, dtype=np.float64), axis=-1)
+    if total is None:
+        total = cumulative[..., -1]
+    needed = (np.asarray(energy) * np.asarray(total, dtype=np.float64))[..., None]
+    ranks = np.sum(cumulative < needed, axis=-1) + 1
+    return np.minimum(ranks, S.shape[-1])
+
+
+def rank_for_psnr(S: np.ndarray, psnr: float, total: np.ndarray, pixels: int) -> np.ndarray:
+    """Smallest rank per matrix whose approximation reaches a target PSNR.
+
+    The squared error of a rank-r approximation is the energy left out,
+    ``total - sum(S[:r]^2)``, so a channel reaches ``psnr`` dB once that
+    tail is below ``pixels * 255^2 / 10^(psnr / 10)``.
+    """
+    total = np.asarray(total, dtype=np.float64)
+    allowed_tail = pixels * 255.0 ** 2 / 10 ** (psnr / 10)
+    energy = np.clip(1 - allowed_tail / np.where(total > 0, total, 1.0), 0.0, 1.0)
+    return rank_for_energy(S, energy, total)
+
+
+def select_ranks(channels: np.ndarray, max_k: int, energy: float = None, psnr: float = None,
+                 svd_method: str = "auto") -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Decompose just far enough to find the smallest rank per channel for a target.
+
+    The decomposition rank starts small and doubles (up to ``max_k``) until
+    every channel reaches the energy or PSNR target inside the computed
+    spectrum, so low-detail images never pay for rank they do not need.
+
+    Args:
+        channels: (c, m, n) float32 planes.
+        max_k: Highest rank allowed per channel.
+        energy: Fraction of spectral energy to keep, e.g. 0.99.
+        psnr: Target PSNR in dB (used when energy is None).
+        svd_method: SVD backend, one of ``SVD_METHODS``.
+
+    Returns:
+        U, S, Vt: Factors covering every selected rank.
+        ranks: Selected rank per channel.
+    """
+    total = frobenius_sq(channels)
+    pixels = channels.shape[-2] * channels.shape[-1]
+    k = min(max_k, 16)
+    while True:
+        U, S, Vt, method, _ = svd_factors(channels, k, svd_method)
+        # An exact decomposition already holds the whole spectrum
+        spectrum = S if method == "exact" else S[..., :k]
+        if energy is not None:
+            ranks = rank_for_energy(spectrum, energy, total)
+        else:
+            ranks = rank_for_psnr(spectrum, psnr, total, pixels)
+        if k >= max_k or method == "exact" or np.all(ranks < k):
+            return U, S, Vt, np.minimum(ranks, max_k)
+        k = min(max_k, 2 * k)
+
+
+def tile_rank_for(k: int, shape: Tuple[int, int], tile_size: int) -> int:
+    """Per-tile rank storing as many coefficients as a global rank-k SVD.
+
+    A global rank k stores k(m + n + 1) numbers per channel, a t x t tile of
+    rank r stores r(2t + 1); solving for r over all tiles gives about
+    k t (m + n) / (2 m n).
+    """
+    m, n = shape
+    return max(1, min(tile_size, round(k * tile_size * (m + n) / (2 * m * n))))
 
-    recon_img = np.dstack(out_channels).clip(0, 255).astype(np.uint8)
+
+def compress_tiles(pixels: np.ndarray, rank: int, tile_size: int = TILE_SIZE,
+                   energy: float = None, svd_method: str = "auto",
+                   workers: int = None) -> Tuple[np.ndarray, np.ndarray]:
+    """Block-wise SVD: approximate every tile of the image independently.
+
+    Each tile is converted to float, decomposed (all channels in one batched
+    call), reconstructed into the output and dropped. Tiles run on a thread
+    pool (LAPACK releases the GIL), so the float working set is about
+    ``workers`` tiles instead of the whole image.
+
+    Args:
+        pixels: (H, W, 3) uint8 image.
+        rank: Rank kept per tile, or the cap when ``energy`` is given.
+        tile_size: Tile edge length in pixels; edge tiles may be smaller.
+        energy: Optional fraction of spectral energy to keep per tile; the
+            rank of each tile is then the smallest one reaching it.
+        svd_method: SVD backend used for every tile.
+        workers: Thread count, defaults to ``tile_workers()``.
+
+    Returns:
+        recon_img: (H, W, 3) uint8 reconstruction.
+        ranks: (rows, cols) array with the rank used for each tile.
+    """
+    height, width, _ = pixels.shape
+    rows = range(0, height, tile_size)
+    cols = range(0, width, tile_size)
+    recon_img = np.empty_like(pixels)
+    ranks = np.zeros((len(rows), len(cols)), dtype=np.int32)
+
+    def work(index: Tuple[int, int]) -> None:
+        i, j = index
+        r0, c0 = rows[i], cols[j]
+        block = pixels[r0:r0 + tile_size, c0:c0 + tile_size]
+        planes = block.transpose(2, 0, 1).astype(np.float32, order="C")
+        k = min(rank, *planes.shape[-2:])
+        U, S, Vt, _, _ = svd_factors(planes, k, svd_method)
+        if energy is not None:
+            total = np.sum(np.square(planes, dtype=np.float64), axis=(-2, -1))
+            k = min(k, int(rank_for_energy(S[..., :k], energy, total).max()))
+        reconstruct_rank_k(U, S, Vt, k, recon_img[r0:r0 + tile_size, c0:c0 + tile_size])
+        ranks[i, j] = k
+
+    indices = [(i, j) for i in range(len(rows)) for j in range(len(cols))]
+    with ThreadPoolExecutor(max_workers=workers or tile_workers()) as pool:
+        # list() re-raises the first tile error, if any
+        list(pool.map(work, indices))
+    return recon_img, ranks
+
+
+COLOR_SPACES = ("rgb", "ycbcr")
+# Chroma rank as a fraction of the luma rank in YCbCr mode
+CHROMA_RANK_FRACTION = 0.25
+# JPEG (ITU-R BT.601 full range) RGB -> YCbCr matrix; chroma is kept centred on 0
+YCBCR_MATRIX = np.array([[0.299, 0.587, 0.114],
+                         [-0.168736, -0.331264, 0.5],
+                         [0.5, -0.418688, -0.081312]], dtype=np.float32)
+RGB_MATRIX = np.linalg.inv(YCBCR_MATRIX).astype(np.float32)
+# Rows per color conversion step; each step holds several float copies of
+# the block, so this is smaller than RECONSTRUCT_BLOCK_ROWS (must be even)
+YCBCR_BLOCK_ROWS = 128
+
+
+def chroma_rank_for(k: int) -> int:
+    """Rank given to each chroma plane when luma gets rank k."""
+    return max(1, round(k * CHROMA_RANK_FRACTION))
+
+
+def split_ycbcr(pixels: np.ndarray, subsample: bool = True,
+                memmap_min_pixels: int = None) -> Tuple[np.ndarray, np.ndarray]:
+    """Convert an (H, W, 3) uint8 image to float32 luma and centred chroma planes.
+
+    The conversion runs in row blocks, so no full-size float RGB or
+    full-size chroma is ever held.
+
+    Returns:
+        luma: (1, H, W) plane, see ``scratch_array`` for memmap_min_pixels.
+        chroma: (2, H, W) Cb, Cr planes, or (2, ceil(H/2), ceil(W/2)) 2x2
+            block means when ``subsample`` is set.
+    """
+    height, width, _ = pixels.shape
+    f = 2 if subsample else 1
+    luma = scratch_array((1, height, width), memmap_min_pixels)
+    chroma = np.empty((2, -(-height // f), -(-width // f)), dtype=np.float32)
+    for r0 in range(0, height, YCBCR_BLOCK_ROWS):
+        r1 = min(r0 + YCBCR_BLOCK_ROWS, height)
+        rgb = pixels[r0:r1].transpose(2, 0, 1).astype(np.float32).reshape(3, -1)
+        planes = (YCBCR_MATRIX @ rgb).reshape(3, r1 - r0, width)
+        luma[0, r0:r1] = planes[0]
+        block = planes[1:]
+        if subsample:
+            # Repeat the last row/column so odd sizes split into whole blocks
+            if (r1 - r0) % 2 or width % 2:
+                block = np.pad(block, ((0, 0), (0, (r1 - r0) % 2), (0, width % 2)), mode="edge")
+            block = _downsample(block, 2)
+        chroma[:, r0 // f:r0 // f + block.shape[-2]] = block
+    return luma, chroma
+
+
+def reconstruct_ycbcr(luma_factors: tuple, chroma_factors: tuple, ranks,
+                      out: np.ndarray) -> np.ndarray:
+    """Write the RGB image of rank-limited luma and chroma factors into out.
+
+    Subsampled chroma is upsampled by pixel repetition. Like
+    ``reconstruct_rank_k`` the rows are produced in blocks, so the float
+    scratch stays small on big images.
+
+    Args:
+        luma_factors: (U, S, Vt) of the (1, m, n) luma plane.
+        chroma_factors: (U, S, Vt) of the (2, m', n') chroma planes.
+        ranks: (luma rank, Cb rank, Cr rank).
+        out: Preallocated (m, n, 3) uint8 image.
+    """
+    def scaled(factors, ks):
+        U, S, Vt = factors
+        kmax = max(ks)
+        Sk = np.where(np.arange(kmax) < np.array(ks)[:, None], S[..., :kmax], 0).astype(S.dtype)
+        return U[..., :kmax] * Sk[..., None, :], Vt[..., :kmax, :]
+
+    Uy, Vy = scaled(luma_factors, ranks[:1])
+    Uc, Vc = scaled(chroma_factors, ranks[1:])
+    m, n, _ = out.shape
+    f = 1 if (Uc.shape[-2], Vc.shape[-1]) == (m, n) else 2
+    block = min(YCBCR_BLOCK_ROWS, m)
+    for r0 in range(0, m, block):
+        r1 = min(r0 + block, m)
+        planes = np.empty((3, r1 - r0, n), dtype=np.float32)
+        np.matmul(Uy[:, r0:r1], Vy, out=planes[:1])
+        c0, c1 = r0 // f, -(-r1 // f)
+        chroma = np.matmul(Uc[:, c0:c1], Vc)
+        if f > 1:
+            chroma = chroma.repeat(f, axis=-2).repeat(f, axis=-1)
+        planes[1:] = chroma[:, r0 - c0 * f:r1 - c0 * f, :n]
+        rgb = (RGB_MATRIX @ planes.reshape(3, -1)).reshape(planes.shape)
+        np.clip(rgb, 0, 255, out=rgb)
+        np.copyto(np.moveaxis(out[r0:r1], -1, 0), rgb, casting="unsafe")
+    return out
+
+
+def compress_ycbcr(pixels: np.ndarray, k: int, chroma_k: int = None, subsample: bool = True,
+                   energy: float = None, psnr: float = None, svd_method: str = "auto",
+                   max_psnr_loss: float = None,
+                   memmap_min_pixels: int = None) -> Tuple[np.ndarray, Tuple[int, int, int]]:
+    """Rank-limited approximation of an image in YCbCr instead of RGB.
+
+    R, G and B are strongly correlated, so most of the detail sits in luma.
+    Luma is decomposed at rank k, the two chroma planes (optionally 2x2
+    subsampled first) at the much smaller ``chroma_k``, which skips most of
+    the SVD work of the RGB path.
+
+    Args:
+        pixels: (H, W, 3) uint8 image.
+        k: Luma rank, or the maximum when energy or psnr is given.
+        chroma_k: Chroma rank (or maximum), defaults to ``chroma_rank_for(k)``.
+        subsample: Decompose chroma at half resolution.
+        energy, psnr: Automatic rank targets as in ``select_ranks``, applied
+            to luma and chroma separately.
+        svd_method: SVD backend, one of ``SVD_METHODS``.
+        max_psnr_loss: Let luma use ``svd_downscaled`` as in ``compress_image``.
+        memmap_min_pixels: File-back the luma plane, see ``scratch_array``.
+
+    Returns:
+        recon_img: (H, W, 3) uint8 reconstruction.
+        ranks: Ranks used for Y, Cb and Cr.
+    """
+    luma, chroma = split_ycbcr(pixels, subsample, memmap_min_pixels)
+    k = max(1, min(k, *luma.shape[-2:]))
+    chroma_k = max(1, min(chroma_k or chroma_rank_for(k), *chroma.shape[-2:]))
+    if energy is not None or psnr is not None:
+        Uy, Sy, Vty, luma_rank = select_ranks(luma, k, energy, psnr, svd_method)
+        Uc, Sc, Vtc, chroma_ranks = select_ranks(chroma, chroma_k, energy, psnr, svd_method)
+        ranks = (int(luma_rank[0]),) + tuple(int(r) for r in chroma_ranks)
+    else:
+        fast = svd_downscaled(luma, k, max_psnr_loss, svd_method) if max_psnr_loss is not None else None
+        Uy, Sy, Vty = fast[:3] if fast is not None else svd_factors(luma, k, svd_method)[:3]
+        if svd_method == "auto" and choose_svd_method(chroma_k, chroma.shape) == "randomized":
+            # Chroma has a flat spectrum, so power iteration often misses the
+            # tolerance; its result after max_iter is still far more accurate
+            # than chroma needs and much cheaper than the exact fallback
+            Uc, Sc, Vtc, _ = _svd_randomized(chroma, chroma_k)
+        else:
+            Uc, Sc, Vtc, _, _ = svd_factors(chroma, chroma_k, svd_method)
+        ranks = (k, chroma_k, chroma_k)
+    recon_img = np.empty_like(pixels)
+    reconstruct_ycbcr((Uy, Sy, Vty), (Uc, Sc, Vtc), ranks, recon_img)
+    return recon_img, ranks
+
+
+MIN_JPEG_QUALITY = 10
+
+
+def encode_jpeg_to_size(img: Image.Image, target_size: int, max_size: int,
+                        initial_quality: int, min_quality: int = MIN_JPEG_QUALITY) -> Tuple[bytes, int, int]:
+    """Encode img as JPEG at the highest quality that meets a size target.
+
+    ``initial_quality`` is the predicted quality and is tried first; when it
+    is too large the quality is binary-searched below it. All trial encodes
+    go to memory and skip Huffman optimisation, only the chosen quality is
+    encoded again with ``optimize=True``. If no quality reaches
+    ``target_size`` the highest quality below ``max_size`` is used, and as a
+    last resort ``min_quality``.
+
+    Args:
+        img: RGB image to encode.
+        target_size: Preferred upper bound for the output size in bytes.
+        max_size: Hard upper bound (output must be smaller than this).
+        initial_quality: Predicted quality, also the highest one considered.
+        min_quality: Lowest quality considered.
+
+    Returns:
+        data: Encoded JPEG bytes.
+        quality: Quality that was used.
+        attempts: Number of trial encodes.
+    """
+    sizes = {}
+
+    def trial(quality: int) -> int:
+        if quality not in sizes:
+            buf = io.BytesIO()
+            with ENCODE_ATTEMPT_SECONDS.time():
+                img.save(buf, format="JPEG", quality=quality)
+            ENCODE_ATTEMPTS.inc()
+            sizes[quality] = buf.tell()
+        return sizes[quality]
+
+    def search(limit: int):
+        # Sizes grow with quality, find the highest quality that fits
+        if trial(initial_quality) <= limit:
+            return initial_quality
+        lo, hi, best = min_quality, initial_quality - 1, None
+        while lo <= hi:
+            mid = (lo + hi) // 2
+            if trial(mid) <= limit:
+                best, lo = mid, mid + 1
+            else:
+                hi = mid - 1
+        return best
+
+    quality = search(target_size)
+    if quality is None:
+        quality = search(max_size - 1)
+    if quality is None:
+        quality = min_quality
+
+    buf = io.BytesIO()
+    with ENCODE_ATTEMPT_SECONDS.time(final="true"):
+        img.save(buf, format="JPEG", quality=quality, optimize=True)
+    ENCODE_ATTEMPTS.inc()
+    return buf.getvalue(), quality, len(sizes)
+
+
+def save_reconstruction(recon_img: np.ndarray, before_size: int,
+                        info_preserved: float) -> Tuple[str, int]:
+    """Encode a reconstruction as a JPEG smaller than the original in the temp dir.
+
+    Args:
+        recon_img: (H, W, 3) uint8 reconstruction.
+        before_size: Size of the original file in bytes.
+        info_preserved: Rank used divided by the maximum rank; higher values
+            start the quality search higher.
+
+    Returns:
+        out_path: Path of the written JPEG.
+        after_size: Its size in bytes.
+    """
     out = Image.fromarray(recon_img)
 
     # Simpan ke direktori temp agar mudah dihapus nanti
     tmpdir = tempfile.gettempdir()
-    ext = os.path.splitext(input_path)[1].lower()
-    
-    # Calculate information preservation ratio
-    info_preserved = k / max_rank
-    
     # Adaptive compression strategy to ensure smaller file size
     # Start with aggressive settings and adjust if needed
-    out_fname = f"svd_{int(time.time())}.jpg"  # Always use JPEG for better compression
+    # Always use JPEG for better compression; the suffix keeps parallel workers apart
+    out_fname = f"svd_{int(time.time())}_{uuid.uuid4().hex[:8]}.jpg"
     
     # Calculate target size (always smaller than original)
     target_size = int(before_size * 0.85)  # Target 85% or less of original size
@@ -96,58 +814,322 @@ def compress_image(input_path: str, k: int) -> Tuple[str, float, int, int, int,
         else:
             initial_quality = 55
     
-    print(f"DEBUG: info_preserved={info_preserved:.3f}, target_size={target_size}, initial_quality={initial_quality}")
-    
-    # Try different quality levels until we get a smaller file
-    quality = initial_quality
-    max_attempts = 8
-    attempt = 0
+    logger.debug("info_preserved=%.3f, target_size=%d, initial_quality=%d",
+                 info_preserved, target_size, initial_quality)
+
+    encoded, quality, attempts = encode_jpeg_to_size(out, target_size, before_size, initial_quality)
+    out_path = os.path.join(tmpdir, out_fname)
+    with open(out_path, "wb") as f:
+        f.write(encoded)
+    after_size = len(encoded)
+    compression_ratio = (before_size - after_size) / before_size * 100
+    logger.debug("quality=%d after %d trial encodes, size=%d, compression=%.1f%%",
+                 quality, attempts, after_size, compression_ratio)
+
+    return out_path, after_size
+
+
+def fixed_rank_factors(channels: np.ndarray, k: int, svd_method: str = "auto", factor_cache=None,
+                       cache_key: str = None, phash: int = None, max_psnr_loss: float = None):
+    """Factors of (3, H, W) planes for a fixed rank k, the way ``compress_image`` finds them.
+
+    With a factor cache, ``headroom_rank(k)`` triplets are computed so the
+    next few larger k are served from it, and the factors of a cached
+    near-duplicate of ``phash`` warm-start the iteration. With
+    ``max_psnr_loss`` the downscaled path is tried before a full
+    decomposition. Storing the result in the cache is left to the caller.
+
+    Returns:
+        U, S, Vt and the name of the method that produced them.
+    """
+    max_rank = min(channels.shape[-2:])
+    # The backend is picked for k, the headroom only adds columns
+    backend = choose_svd_method(k, channels.shape) if svd_method == "auto" else svd_method
+    rank = headroom_rank(k, max_rank) if factor_cache is not None else k
+    # An edited or re-encoded copy of a cached image converges from that
+    # image's factors in fewer passes
+    neighbour = factor_cache.nearest(phash, cache_key) if phash is not None else None
+    if neighbour is not None and svd_method != "exact":
+        found = svd_warm_start(channels, rank, neighbour[3])
+        logger.debug("warm start from %s %s", neighbour[0],
+                     "converged" if found is not None else "did not converge")
+        if found is not None:
+            return found + ("warm",)
+    if max_psnr_loss is not None:
+        fast = svd_downscaled(channels, k, max_psnr_loss, backend, rank=rank)
+        if fast is not None:
+            method = f"downscale{fast[3]}"
+            logger.debug("method=%s, PSNR loss <= %.2f dB", method, fast[4])
+            return fast[:3] + (method,)
+    U, S, Vt, method, rel_error = svd_factors(channels, rank, backend)
+    logger.debug("method=%s, rank=%d, rel_error=%s", method, rank, rel_error)
+    return U, S, Vt, method
+
+
+def load_factors(input_path: str, k: int, factor_cache=None, cache_key: str = None,
+                 svd_method: str = "auto") -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Stacked RGB factors of an image covering rank k, from the cache if possible.
+
+    Returns:
+        U (3, H, r), S (3, r), Vt (3, r, W) with r >= min(k, H, W).
+    """
+    if factor_cache is not None:
+        factors = factor_cache.get(cache_key, k)
+        if factors is not None:
+            return factors
+    channels = float_planes(load_pixels(input_path))
+    max_rank = min(channels.shape[1:])
+    k = max(1, min(k, max_rank))
+    if svd_method == "auto":
+        svd_method = choose_svd_method(k, channels.shape)
+    rank = headroom_rank(k, max_rank) if factor_cache is not None else k
+    U, S, Vt, _, _ = svd_factors(channels, rank, svd_method)
+    if factor_cache is not None:
+        factor_cache.put(cache_key, U, S, Vt, min_rank=rank)
+    return U, S, Vt
+
+
+def compress_image(input_path: str, k: int, svd_method: str = "auto",
+                   factor_cache=None, cache_key: str = None,
+                   data: bytes = None, progress=None, tile_size: int = None,
+                   tile_energy: float = None, energy: float = None,
+                   target_psnr: float = None, max_psnr_loss: float = None,
+                   color_space: str = "rgb", memmap_min_pixels: int = None,
+                   tiled_min_pixels: int = None) -> Tuple[str, float, int, int, int, int, Tuple[int, ...]]:
+    """Compress an RGB image using Singular Value Decomposition.
     
-    while attempt < max_attempts:
-        out_path = os.path.join(tmpdir, out_fname)
-        
-        # Save with current quality
-        save_kwargs = {'format': 'JPEG', 'quality': quality, 'optimize': True}
-        if out.mode != 'RGB':
-            out = out.convert('RGB')
-        out.save(out_path, **save_kwargs)
-        
-        after_size = os.path.getsize(out_path)
-        compression_ratio = (before_size - after_size) / before_size * 100
-        
-        print(f"DEBUG: Attempt {attempt+1}, quality={quality}, size={after_size}, compression={compression_ratio:.1f}%")
-        
-        # Success: file is smaller than original
-        if after_size < before_size:
-            print(f"DEBUG: Success! Final size: {after_size} bytes ({compression_ratio:.1f}% smaller)")
-            break
-        
-        # If still too large, reduce quality more aggressively
-        if quality > 30:
-            quality -= 10
-        elif quality > 20:
-            quality -= 5
-        elif quality > 10:
-            quality -= 2
-        else:
-            quality = 10
-            break
-            
-        attempt += 1
+    This function implements an adaptive compression strategy that ensures
+    the output file is always smaller than the input file.
+
+    Args:
+        input_path: Full path to input image file.
+        k: Number of singular values to keep (per channel).
+        svd_method: SVD backend, one of ``SVD_METHODS``. ``"auto"`` uses a
+            truncated solver when k is small relative to the image.
+        factor_cache: Optional ``FactorCache``. When it already holds factors
+            for ``cache_key`` covering rank k, decoding and SVD are skipped;
+            otherwise the new factors are stored in it. The factors of a
+            near-duplicate upload found by ``FactorCache.nearest`` warm-start
+            the decomposition (see ``svd_warm_start``).
+        cache_key: Key of the image in ``factor_cache`` (its file hash).
+        data: Contents of ``input_path`` when already in memory; the image is
+            then decoded from these bytes instead of reopening the file.
+        progress: Optional ``progress(stage, fraction)`` callback, called as
+            the decode, svd, reconstruct and encode stages start.
+        tile_size: When set, use block-wise SVD on tiles of this size with
+            a per-tile rank storing as many coefficients as global rank k.
+            Bounds memory on very large images; the factor cache is not used.
+        tile_energy: In tiled mode, keep only the smallest per-tile rank that
+            holds this fraction of spectral energy (capped by the rank above).
+        energy: Choose the smallest rank per channel keeping this fraction
+            of spectral energy (e.g. 0.99); ``k`` then acts as the maximum.
+        target_psnr: Like ``energy`` but choose the smallest rank per
+            channel reaching this PSNR in dB.
+        max_psnr_loss: When set, first try ``svd_downscaled`` and use its
+            factors if they provably cost at most this many dB of PSNR
+            against the exact rank-k path. Only applies to a fixed k.
+        color_space: One of ``COLOR_SPACES``. ``"ycbcr"`` approximates luma
+            at rank k and 2x subsampled chroma at ``chroma_rank_for(k)``
+            (see ``compress_ycbcr``); the factor cache is not used.
+        memmap_min_pixels: Images with at least this many pixels keep their
+            float planes in a temporary file (see ``scratch_array``).
+        tiled_min_pixels: Images with at least this many pixels use the
+            block-wise mode with ``TILE_SIZE`` tiles when ``tile_size`` is
+            not given; this overrides ``color_space``.
+
+    The peak RSS of the process during the call is logged and observed in
+    ``compress_peak_rss_bytes``. It covers everything the process does
+    meanwhile, so concurrent compressions in one worker share one peak.
+
+    Returns:
+        out_path: Path where compressed image is stored.
+        runtime: Compression runtime in seconds.
+        before_size: Original file size in bytes.
+        after_size: Compressed file size in bytes.
+        height: Image height (pixels).
+        width: Image width (pixels).
+        ranks: Rank used for each of the R, G, B channels (Y, Cb, Cr in
+            YCbCr mode).
+    """
+    if color_space not in COLOR_SPACES:
+        raise ValueError(f"Unknown color space: {color_space}")
+    start = time.time()
+    memory.reset_peak()
+    auto_rank = energy is not None or target_psnr is not None
+    ycbcr = color_space == "ycbcr" and not tile_size
+
+    if data is not None:
+        before_size = len(data)
+    elif os.path.isfile(input_path):
+        before_size = os.path.getsize(input_path)
+    else:
+        raise FileNotFoundError(f"{input_path} tidak ditemukan.")
+
+    factors = None
+    # The cache has no total energy, which automatic rank selection needs
+    if factor_cache is not None and not tile_size and not auto_rank and not ycbcr:
+        factors = factor_cache.get(cache_key, k)
+    if factors is not None:
+        U, S, Vt = factors
+        height, width = U.shape[-2], Vt.shape[-1]
+        logger.debug("Factor cache hit, stored rank: %d", S.shape[-1])
+    else:
+        if progress:
+            progress("decode", 0.05)
+        with STAGE_SECONDS.time(stage="decode"):
+            pixels = load_pixels(input_path, data)
+        height, width, _ = pixels.shape
+        if not tile_size and tiled_min_pixels and height * width >= tiled_min_pixels:
+            tile_size = TILE_SIZE
+            ycbcr = False
+            logger.debug("%dx%d image, using %dpx tiles", width, height, tile_size)
+
+    # Pastikan k tidak lebih besar dari dimensi minimum
+    max_rank = min(height, width)
+    k = max(1, min(k, max_rank))
     
-    # Final save with determined quality
-    if attempt >= max_attempts or after_size >= before_size:
-        # Emergency fallback: very low quality
-        quality = 15
-        save_kwargs = {'format': 'JPEG', 'quality': quality, 'optimize': True}
-        out.save(out_path, **save_kwargs)
-        after_size = os.path.getsize(out_path)
-        print(f"DEBUG: Emergency fallback, quality={quality}, final_size={after_size}")
+    logger.debug("Original size: %d bytes, k: %d, max_rank: %d", before_size, k, max_rank)
+
+    ranks = (k,) * 3
+    if tile_size:
+        if progress:
+            progress("svd", 0.1)
+        tile_rank = tile_rank_for(k, (height, width), tile_size)
+        with STAGE_SECONDS.time(stage="tiled"):
+            recon_img, tile_ranks = compress_tiles(pixels, tile_rank, tile_size,
+                                                   energy=tile_energy, svd_method=svd_method)
+        logger.debug("tiled %s tiles of %dpx, mean rank=%.1f", tile_ranks.shape, tile_size, tile_ranks.mean())
+    elif ycbcr:
+        if progress:
+            progress("svd", 0.1)
+        with STAGE_SECONDS.time(stage="ycbcr"):
+            recon_img, ranks = compress_ycbcr(pixels, k, energy=energy, psnr=target_psnr,
+                                              svd_method=svd_method, max_psnr_loss=max_psnr_loss,
+                                              memmap_min_pixels=memmap_min_pixels)
+        logger.debug("ycbcr ranks=%s", ranks)
+    else:
+        if factors is None:
+            if progress:
+                progress("svd", 0.1)
+            phash = dhash(pixels) if factor_cache is not None else None
+            # Contiguous (3, H, W) planes so all channels go through one batched SVD
+            channels = float_planes(pixels, memmap_min_pixels)
+            del pixels
+            svd_start = time.perf_counter()
+            if auto_rank:
+                U, S, Vt, selected = select_ranks(channels, k, energy, target_psnr, svd_method)
+                ranks = tuple(int(r) for r in selected)
+                method = "auto_rank"
+                logger.debug("selected ranks=%s (energy=%s, psnr=%s)", ranks, energy, target_psnr)
+            else:
+                U, S, Vt, method = fixed_rank_factors(channels, k, svd_method, factor_cache,
+                                                      cache_key, phash, max_psnr_loss)
+            # One batched call covers all channels, report the time per channel
+            STAGE_SECONDS.observe((time.perf_counter() - svd_start) / len(channels),
+                                  stage="svd_channel", method=method)
+            del channels
+            if factor_cache is not None:
+                factor_cache.put(cache_key, U, S, Vt, min_rank=max(ranks) if auto_rank else S.shape[-1])
+                factor_cache.remember(cache_key, phash, height, width)
+
+        # buang singular value kecil
+        if progress:
+            progress("reconstruct", 0.7)
+        recon_img = np.empty((height, width, 3), dtype=np.uint8)
+        with STAGE_SECONDS.time(stage="reconstruct"):
+            reconstruct_rank_k(U, S, Vt, np.array(ranks) if auto_rank else k, recon_img)
+
+    # Calculate information preservation ratio
+    info_preserved = max(ranks) / max_rank
+    if progress:
+        progress("encode", 0.8)
+    with STAGE_SECONDS.time(stage="encode"):
+        out_path, after_size = save_reconstruction(recon_img, before_size, info_preserved)
 
     runtime = time.time() - start
+    STAGE_SECONDS.observe(runtime, stage="total")
+    peak = memory.peak_rss()
+    PEAK_RSS.observe(peak)
+    logger.info("Compressed %dx%d at k=%d in %.2fs, peak RSS %d MB",
+                width, height, k, runtime, peak // (1024 * 1024))
     
-    # Ensure we always report a smaller file (even if minimal reduction)
     if after_size >= before_size:
-        print(f"WARNING: Could not achieve size reduction. Original: {before_size}, Final: {after_size}")
+        logger.warning("Could not achieve size reduction. Original: %d, Final: %d", before_size, after_size)
+
+    return out_path, runtime, before_size, after_size, height, width, ranks
+
+
+def compress_sweep(input_path: str, ks, svd_method: str = "auto", factor_cache=None,
+                   cache_key: str = None, data: bytes = None, workers: int = None,
+                   max_psnr_loss: float = None, memmap_min_pixels: int = None,
+                   tiled_min_pixels: int = None) -> List[Tuple[str, float, int, int, int, int, Tuple[int, ...]]]:
+    """Compress one image at several ranks with a single decomposition.
+
+    The factors for the largest k are computed (or taken from
+    ``factor_cache``) once, by ``fixed_rank_factors`` as in
+    ``compress_image``, so the memmap, tiling and downscale options act as
+    they do there. Reconstructions are built incrementally in
+    increasing k, and each is JPEG-encoded on a thread pool while the next
+    one is reconstructed. Images at or above ``tiled_min_pixels`` have no
+    global factors and are compressed tile-wise once per k.
+
+    Args:
+        input_path: Full path to input image file.
+        ks: Ranks to produce; clamped to the image and deduplicated.
+        svd_method, factor_cache, cache_key, data, max_psnr_loss,
+            memmap_min_pixels, tiled_min_pixels: As for ``compress_image``.
+        workers: Encoder threads, defaults to one per k up to the core count.
+
+    Returns:
+        One ``compress_image`` style tuple per distinct k, in increasing k.
+        The runtime of each is the shared decode and SVD time plus that k's
+        own reconstruction and encoding time.
+    """
+    start = time.time()
+    if data is not None:
+        before_size = len(data)
+    elif os.path.isfile(input_path):
+        before_size = os.path.getsize(input_path)
+    else:
+        raise FileNotFoundError(f"{input_path} tidak ditemukan.")
+
+    kmax = max(ks)
+    factors = factor_cache.get(cache_key, kmax) if factor_cache is not None else None
+    if factors is not None:
+        U, S, Vt = factors
+    else:
+        pixels = load_pixels(input_path, data)
+        height, width, _ = pixels.shape
+        if tiled_min_pixels and height * width >= tiled_min_pixels:
+            del pixels
+            return [compress_image(input_path, k, svd_method, data=data, tiled_min_pixels=tiled_min_pixels)
+                    for k in sorted({max(1, min(int(k), height, width)) for k in ks})]
+        phash = dhash(pixels) if factor_cache is not None else None
+        channels = float_planes(pixels, memmap_min_pixels)
+        del pixels
+        U, S, Vt, method = fixed_rank_factors(channels, max(1, min(kmax, height, width)), svd_method,
+                                              factor_cache, cache_key, phash, max_psnr_loss)
+        del channels
+        logger.debug("sweep factors by %s, rank %d", method, S.shape[-1])
+        if factor_cache is not None:
+            factor_cache.put(cache_key, U, S, Vt, min_rank=S.shape[-1])
+            factor_cache.remember(cache_key, phash, height, width)
+    height, width = U.shape[-2], Vt.shape[-1]
+    max_rank = min(height, width)
+    ks = sorted({max(1, min(int(k), max_rank)) for k in ks})
+    shared = time.time() - start
+    logger.debug("sweep ks=%s, shared decode+svd %.3fs", ks, shared)
+
+    def encode(k: int, recon_img: np.ndarray, recon_time: float) -> tuple:
+        t0 = time.time()
+        out_path, after_size = save_reconstruction(recon_img, before_size, k / max_rank)
+        runtime = shared + recon_time + time.time() - t0
+        return out_path, runtime, before_size, after_size, height, width, (k,) * 3
 
-    return out_path, runtime, before_size, after_size, height, width 
\ No newline at end of file
+    with ThreadPoolExecutor(max_workers=workers or min(len(ks), os.cpu_count() or 1)) as pool:
+        futures = []
+        t0 = time.time()
+        for k, pixels in progressive_reconstruct(U, S, Vt, ks):
+            futures.append(pool.submit(encode, k, pixels.copy(), time.time() - t0))
+            t0 = time.time()
+        return [future.result() for future in futures]
@@ -0,0 +1,175 @@
+"""
+Compact .svd container holding truncated, quantized SVD factors
+
+Layout (little endian):
+
+    header   32 bytes: magic b"SVDC", version u8, quant u8, codec u8,
+             channels u8, height u32, width u32, rank u32, 12 reserved
+    payload  S        float32 (c, rank)
+             U scales float32 (c, rank)   (int8 only)
+             U^T      quant   (c, rank, height)
+             V scales float32 (c, rank)   (int8 only)
+             Vt       quant   (c, rank, width)
+
+Singular vectors are stored as rows so the first k of them are contiguous,
+and an uncompressed file can be memory-mapped and sliced to any k <= rank
+without reading the rest. With a codec the payload is compressed as a whole.
+"""
+import contextlib
+import lzma
+import os
+import struct
+import threading
+import zlib
+from typing import Tuple
+
+import numpy as np
+
+MAGIC = b"SVDC"
+VERSION = 1
+HEADER = struct.Struct("<4sBBBBIII12x")
+
+QUANTS = {"float32": 0, "float16": 1, "int8": 2}
+CODECS = {"none": 0, "zlib": 1, "lzma": 2}
+_QUANT_DTYPES = {0: np.float32, 1: np.float16, 2: np.int8}
+
+
+class SVDFormatError(ValueError):
+    """Raised when a file is not a valid .svd container."""
+
+
+def _quantize(vectors: np.ndarray, quant: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Quantize (c, r, len) row vectors; int8 gets one scale per vector."""
+    if quant != QUANTS["int8"]:
+        return vectors.astype(_QUANT_DTYPES[quant]), None
+    scales = np.abs(vectors).max(axis=-1).astype(np.float32) / 127
+    scales[scales == 0] = 1
+    q = np.rint(vectors / scales[..., None]).astype(np.int8)
+    return q, scales
+
+
+def write_svd(path: str, U: np.ndarray, S: np.ndarray, Vt: np.ndarray, k: int = None,
+              quant: str = "int8", codec: str = "zlib") -> int:
+    """Write the first k factors of stacked (c, m, r), (c, r), (c, r, n) arrays.
+
+    Args:
+        path: Destination file; written atomically.
+        U, S, Vt: Stacked factors.
+        k: Rank to store, defaults to all available.
+        quant: "float32", "float16" or "int8" (per-vector scale).
+        codec: "none" (memory-mappable), "zlib" or "lzma".
+
+    Returns:
+        Size of the written file in bytes.
+    """
+    if quant not in QUANTS or codec not in CODECS:
+        raise ValueError(f"Unsupported quant/codec: {quant}/{codec}")
+    k = S.shape[-1] if k is None else min(k, S.shape[-1])
+    channels, height, _ = U.shape
+    width = Vt.shape[-1]
+
+    parts = [np.ascontiguousarray(S[..., :k], dtype=np.float32)]
+    for vectors in (np.swapaxes(U[..., :k], -1, -2), Vt[..., :k, :]):
+        q, scales = _quantize(vectors, QUANTS[quant])
+        if scales is not None:
+            parts.append(scales)
+        parts.append(np.ascontiguousarray(q))
+    payload = b"".join(part.tobytes() for part in parts)
+    if codec == "zlib":
+        payload = zlib.compress(payload, 6)
+    elif codec == "lzma":
+        payload = lzma.compress(payload)
+
+    header = HEADER.pack(MAGIC, VERSION, QUANTS[quant], CODECS[codec], channels, height, width, k)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(header)
+            f.write(payload)
+        os.replace(tmp_path, path)
+    except BaseException:
+        # A full disk or an interrupt must not leave partial files behind
+        with contextlib.suppress(OSError):
+            os.remove(tmp_path)
+        raise
+    return HEADER.size + len(payload)
+
+
+def read_header(path: str) -> dict:
+    """Read and validate the header of an .svd file."""
+    with open(path, "rb") as f:
+        raw = f.read(HEADER.size)
+    if len(raw) < HEADER.size:
+        raise SVDFormatError(f"{path}: truncated header")
+    magic, version, quant, codec, channels, height, width, rank = HEADER.unpack(raw)
+    if magic != MAGIC or version != VERSION or quant not in _QUANT_DTYPES or codec not in CODECS.values():
+        raise SVDFormatError(f"{path}: not an SVDC v{VERSION} file")
+    return {"quant": quant, "codec": codec, "channels": channels,
+            "height": height, "width": width, "rank": rank}
+
+
+def payload_size(hdr: dict) -> int:
+    """Uncompressed payload size in bytes implied by a header from ``read_header``."""
+    c, m, n, rank = hdr["channels"], hdr["height"], hdr["width"], hdr["rank"]
+    scales = 2 if hdr["quant"] == QUANTS["int8"] else 0
+    itemsize = np.dtype(_QUANT_DTYPES[hdr["quant"]]).itemsize
+    return c * rank * 4 * (1 + scales) + c * rank * (m + n) * itemsize
+
+
+def read_svd(path: str, k: int = None) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Decode the first k factors of an .svd file into float32 arrays.
+
+    Uncompressed files are memory-mapped, so only the pages holding the
+    first k vectors are read.
+
+    Returns:
+        U (c, m, k), S (c, k), Vt (c, k, n) as float32.
+
+    Raises:
+        SVDFormatError: The payload does not decode to the size the header
+            implies, e.g. a file truncated by a crash.
+    """
+    hdr = read_header(path)
+    c, m, n, rank = hdr["channels"], hdr["height"], hdr["width"], hdr["rank"]
+    k = rank if k is None else min(k, rank)
+    dtype = np.dtype(_QUANT_DTYPES[hdr["quant"]])
+    scaled = hdr["quant"] == QUANTS["int8"]
+
+    expected = payload_size(hdr)
+    if hdr["codec"] == CODECS["none"]:
+        if os.path.getsize(path) - HEADER.size != expected:
+            raise SVDFormatError(f"{path}: payload size does not match header")
+        buf = np.memmap(path, dtype=np.uint8, mode="r", offset=HEADER.size) if expected else np.empty(0, np.uint8)
+    else:
+        with open(path, "rb") as f:
+            f.seek(HEADER.size)
+            raw = f.read()
+        try:
+            raw = zlib.decompress(raw) if hdr["codec"] == CODECS["zlib"] else lzma.decompress(raw)
+        except (zlib.error, lzma.LZMAError) as e:
+            raise SVDFormatError(f"{path}: corrupt payload ({e})") from e
+        if len(raw) != expected:
+            raise SVDFormatError(f"{path}: payload size does not match header")
+        buf = np.frombuffer(raw, dtype=np.uint8)
+
+    offset = 0
+
+    def take(shape, dt) -> np.ndarray:
+        nonlocal offset
+        count = int(np.prod(shape))
+        arr = buf[offset:offset + count * dt.itemsize].view(dt).reshape(shape)
+        offset += count * dt.itemsize
+        return arr
+
+    f32 = np.dtype(np.float32)
+    S = np.array(take((c, rank), f32)[:, :k])
+    vectors = []
+    for length in (m, n):
+        scales = take((c, rank), f32)[:, :k] if scaled else None
+        q = take((c, rank, length), dtype)[:, :k]
+        v = q.astype(np.float32)
+        if scales is not None:
+            v *= scales[..., None]
+        vectors.append(v)
+    U = np.ascontiguousarray(np.swapaxes(vectors[0], -1, -2))
+    return U, S, vectors[1]
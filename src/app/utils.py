@@ -1,9 +1,21 @@
 import os
 import hashlib
 import json
+import logging
+import shutil
 import time
 
 ALLOWED_EXTENSIONS = {"png", "jpg", "jpeg"}
+# Cache index files living next to the cached images
+CACHE_METADATA_SUFFIXES = (".json", ".db", ".db-wal", ".db-shm")
+# Read size for hashing and upload streaming
+CHUNK_SIZE = 1024 * 1024
+# Part of every cache key; bump when compression output changes
+ALGORITHM_VERSION = "v3_downscale"
+# Hex digits of the content hash used as the name of a cached output
+BLOB_NAME_CHARS = 32
+
+logger = logging.getLogger(__name__)
 
 def allowed_file(filename: str) -> bool:
     """Return True if filename has an allowed image extension."""
@@ -15,13 +27,126 @@ def get_file_hash(filepath: str) -> str:
     hash_sha256 = hashlib.sha256()
     try:
         with open(filepath, "rb") as f:
-            for chunk in iter(lambda: f.read(4096), b""):
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
                 hash_sha256.update(chunk)
         return hash_sha256.hexdigest()
     except Exception:
         return ""
 
 
+def save_upload(stream, dest_path: str, max_in_memory: int = 16 * 1024 * 1024) -> tuple:
+    """Write an upload stream to dest_path and hash it in the same pass.
+
+    Args:
+        stream: Readable binary stream (e.g. ``FileStorage.stream``).
+        dest_path: Where the upload is written.
+        max_in_memory: Uploads up to this size are also returned as bytes so
+            they can be decoded without reading the file again.
+
+    Returns:
+        file_hash: SHA-256 hex digest of the upload.
+        data: The upload bytes, or None when larger than max_in_memory.
+    """
+    hash_sha256 = hashlib.sha256()
+    chunks = []
+    total = 0
+    with open(dest_path, "wb") as f:
+        for chunk in iter(lambda: stream.read(CHUNK_SIZE), b""):
+            hash_sha256.update(chunk)
+            f.write(chunk)
+            total += len(chunk)
+            if chunks is not None:
+                chunks.append(chunk)
+                if total > max_in_memory:
+                    chunks = None
+    data = b"".join(chunks) if chunks is not None else None
+    return hash_sha256.hexdigest(), data
+
+
+def make_cache_key(file_hash: str, k: int, energy: float = None, target_psnr: float = None,
+                   color_space: str = "rgb", max_psnr_loss: float = None,
+                   tiled_min_pixels: int = None, tile_size: int = None) -> str:
+    """Cache key of one (image, k) result, plus the automatic rank target,
+    color space, allowed downscaling loss and tiling if not the defaults."""
+    cache_key = f"{file_hash}_{k}_{ALGORITHM_VERSION}"
+    if energy is not None:
+        cache_key += f"_e{energy}"
+    if target_psnr is not None:
+        cache_key += f"_p{target_psnr}"
+    if color_space != "rgb":
+        cache_key += f"_{color_space}"
+    if max_psnr_loss is not None:
+        cache_key += f"_l{max_psnr_loss}"
+    if tile_size is not None:
+        cache_key += f"_t{tile_size}"
+    elif tiled_min_pixels is not None:
+        cache_key += f"_tm{tiled_min_pixels}"
+    return cache_key
+
+
+def blob_name(src_path: str) -> str:
+    """Name of a file in a content-addressed folder: its hash plus extension."""
+    return get_file_hash(src_path)[:BLOB_NAME_CHARS] + os.path.splitext(src_path)[1]
+
+
+def store_blob(src_path: str, folder: str, name: str = None) -> str:
+    """Move a file into folder, named after the hash of its content.
+
+    Identical outputs therefore share one file: when the name exists
+    already, src_path is only removed.
+
+    Args:
+        src_path: File to move.
+        folder: Destination folder.
+        name: ``blob_name(src_path)``, when already known.
+
+    Returns:
+        The file name inside folder.
+    """
+    name = name or blob_name(src_path)
+    dest_path = os.path.join(folder, name)
+    if os.path.exists(dest_path):
+        os.remove(src_path)
+    else:
+        # A rename within the temp filesystem, no bytes are copied
+        shutil.move(src_path, dest_path)
+    return name
+
+
+def cache_result(cache_store, cache_folder: str, cache_key: str, result: tuple) -> dict:
+    """Move a compress_image result into cache_folder and record it in cache_store.
+
+    The output file is stored by ``store_blob``, so afterwards it only
+    exists as ``cache_folder/<output_filename>``.
+
+    Returns:
+        The stored cache entry.
+    """
+    out_path, runtime, before_size, after_size, height, width, ranks = result
+    output_filename = blob_name(out_path)
+
+    ratio = (before_size - after_size) / before_size * 100
+    ratio_str = f"{ratio:.2f}%" if ratio >=0 else f"+{abs(ratio):.2f}% (lebih besar)"
+    cache_entry = {
+        "output_filename": output_filename,
+        "runtime": runtime,
+        "ratio_str": ratio_str,
+        "dimension": f"{height}×{width}",
+        "before_size_kb": f"{before_size / 1024:.2f}",
+        "after_size_kb": f"{after_size / 1024:.2f}",
+        "ranks": list(ranks),
+        "timestamp": time.time()
+    }
+    # Placing the file inside the insert transaction keeps an eviction in
+    # another worker from unlinking a shared output in between
+    stored = cache_store.put(cache_key, cache_entry, size_bytes=after_size,
+                             place=lambda: store_blob(out_path, cache_folder, output_filename))
+    if not stored and os.path.exists(out_path):
+        # Not cached, but the result page still needs the file
+        store_blob(out_path, cache_folder, output_filename)
+    return cache_entry
+
+
 def load_cache(cache_file: str) -> dict:
     """Load cache data from JSON file."""
     if not os.path.exists(cache_file):
@@ -34,18 +159,6 @@ def load_cache(cache_file: str) -> dict:
         return {}
 
 
-def save_cache(cache_file: str, cache_data: dict) -> bool:
-    """Save cache data to JSON file."""
-    try:
-        os.makedirs(os.path.dirname(cache_file), exist_ok=True)
-        with open(cache_file, 'w') as f:
-            json.dump(cache_data, f, indent=2)
-        return True
-    except Exception as e:
-        print(f"Error saving cache: {e}")
-        return False
-
-
 def cleanup_old_files(directory: str, max_age_hours: int = 24) -> int:
     """Remove files older than max_age_hours from directory."""
     if not os.path.exists(directory):
@@ -57,7 +170,7 @@ def cleanup_old_files(directory: str, max_age_hours: int = 24) -> int:
     
     try:
         for filename in os.listdir(directory):
-            if filename.endswith('.json'):  # Skip cache metadata files
+            if filename.endswith(CACHE_METADATA_SUFFIXES):  # Skip cache metadata files
                 continue
                 
             filepath = os.path.join(directory, filename)
@@ -66,54 +179,28 @@ def cleanup_old_files(directory: str, max_age_hours: int = 24) -> int:
                 if file_age > max_age_seconds:
                     os.remove(filepath)
                     removed_count += 1
-                    print(f"Removed old file: {filename}")
+                    logger.debug("Removed old file: %s", filename)
     except Exception as e:
-        print(f"Error during cleanup: {e}")
+        logger.error("Error during cleanup: %s", e)
     
     return removed_count
 
 
-def cleanup_cache_entries(cache_file: str, cache_folder: str) -> int:
+def cleanup_cache_entries(cache_store, cache_folder: str) -> int:
     """Remove cache entries for files that no longer exist."""
-    cache_data = load_cache(cache_file)
-    if not cache_data:
-        return 0
-    
     removed_count = 0
-    keys_to_remove = []
-    
-    for cache_key, entry in cache_data.items():
+    for cache_key, entry in cache_store.items():
         cached_file_path = os.path.join(cache_folder, entry.get("output_filename", ""))
         if not os.path.exists(cached_file_path):
-            keys_to_remove.append(cache_key)
+            cache_store.delete(cache_key)
             removed_count += 1
     
-    for key in keys_to_remove:
-        del cache_data[key]
-    
-    if keys_to_remove:
-        save_cache(cache_file, cache_data)
-        print(f"Removed {removed_count} stale cache entries")
+    if removed_count:
+        logger.info("Removed %d stale cache entries", removed_count)
     
     return removed_count
 
 
-def get_cache_size(cache_folder: str) -> tuple:
-    """Get cache folder size and file count."""
-    if not os.path.exists(cache_folder):
-        return 0, 0
-    
-    total_size = 0
-    file_count = 0
-    
-    try:
-        for dirpath, dirnames, filenames in os.walk(cache_folder):
-            for filename in filenames:
-                if not filename.endswith('.json'):
-                    filepath = os.path.join(dirpath, filename)
-                    total_size += os.path.getsize(filepath)
-                    file_count += 1
-    except Exception:
-        pass
-    
-    return total_size, file_count
\ No newline at end of file
+def get_cache_size(cache_store) -> tuple:
+    """Get cache size in bytes and entry count from the store's counters."""
+    return cache_store.stats()
@@ -23,6 +23,17 @@ export FLASK_ENV=production
 # Test imports before starting
 python -c "import sys; sys.path.append('..'); from svd import compress_image; from utils import allowed_file; print('✅ Imports successful')" || exit 1
 
+# Every gunicorn thread may run an SVD at once; give each one its share of
+# the cores instead of letting each BLAS call spawn a thread per core
+GUNICORN_WORKERS=${GUNICORN_WORKERS:-2}
+GUNICORN_THREADS=${GUNICORN_THREADS:-4}
+BLAS_THREADS=$(( $(nproc) / (GUNICORN_WORKERS * GUNICORN_THREADS) ))
+[ "$BLAS_THREADS" -ge 1 ] || BLAS_THREADS=1
+export OPENBLAS_NUM_THREADS=${OPENBLAS_NUM_THREADS:-$BLAS_THREADS}
+export OMP_NUM_THREADS=${OMP_NUM_THREADS:-$BLAS_THREADS}
+export MKL_NUM_THREADS=${MKL_NUM_THREADS:-$BLAS_THREADS}
+echo "BLAS threads per call: $OPENBLAS_NUM_THREADS"
+
 # Start with verbose logging
 echo "Starting gunicorn..."
-exec gunicorn --bind 0.0.0.0:8000 --timeout 600 --workers 1 --access-logfile - --error-logfile - --log-level info app:app 
\ No newline at end of file
+exec gunicorn --bind 0.0.0.0:8000 --timeout 600 --workers $GUNICORN_WORKERS --threads $GUNICORN_THREADS --access-logfile - --error-logfile - --log-level info app:app